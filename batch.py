@@ -0,0 +1,213 @@
+"""
+Headless batch reports: one Excel report (and optional summary grids) per
+measurement archive, without the Streamlit UI.
+
+    python batch.py path/to/zips -o reports -j 4 --html
+    python batch.py path/to/zips --cohort cohort  # plus one Parquet dataset of all
+    python batch.py path/to/zips --store store    # plus save them for the dashboard
+    python batch.py path/to/zips --similarity index --pca 32  # plus index their curves
+    python batch.py healthy/zips --norms norms.npz --norm-files norms  # plus a lab reference
+
+
+Every archive is processed in a worker process. Progress goes to stderr,
+followed by a summary listing the archives that failed; the exit code is 1
+if any did.
+"""
+import argparse
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+
+def load(path: str):
+    """DataSet of one archive, keyed by the content hash like the UI cache"""
+    from cache import ParseCache
+    from core import Config, DataSet
+    from ingest import read_archive
+
+    c = Config.load()
+    with open(path, "rb") as f:
+        data = f.read()
+    tables = read_archive(data, c.required_files(), {c.info["file"]})
+    return DataSet(tables, ParseCache.digest(data, c.digest), ParseCache.digest(data))
+
+
+def output_stem(path: str, root: str) -> str:
+    """Output name of the archive `path` found under `root`: its relative path without extension"""
+    return os.path.splitext(os.path.relpath(path, root))[0]
+
+
+def report(
+    path: str, out_dir: str, html: bool = False, png: bool = False, full: bool = False, d=None, name: str = None
+) -> list:
+    """
+    Process one archive and write its outputs to `out_dir`; `d` is its
+    DataSet if already loaded. Outputs are named after `name` (see
+    `output_stem`), by default the archive's base name; subfolders of
+    `name` are created in `out_dir`.
+
+    The workbook holds the title, subject info, temporal and spatial
+    parameters and the stats of every kinematics and kinetics parameter for
+    the config phases. With `full`, the workbook is streamed and also gets
+    a stats sheet and one sheet of mean, normative and trial curves per
+    parameter (see `core.StreamExport`).
+
+    Returns
+    -------
+    list of str
+        Paths of the written files.
+    """
+    from core import Config, Export, StreamExport
+
+    c = Config.load()
+    d = d or load(path)
+    stem = os.path.join(out_dir, name or os.path.splitext(os.path.basename(path))[0])
+    os.makedirs(os.path.dirname(stem), exist_ok=True)
+    written = []
+
+    stats_map = {
+        param: {"df_stats": dfs.stats_table(c.phases), "comments": ""}
+        for domain in (d.kinematics, d.kinetics)
+        for param, dfs in domain.items()
+    }
+    if full:
+        StreamExport.write(f"{stem}.xlsx", d, stats_map, c.phases)
+    else:
+        with open(f"{stem}.xlsx", "wb") as f:
+            f.write(Export.to_bytes(d, stats_map))
+    written.append(f"{stem}.xlsx")
+
+    if html or png:
+        from plots import layout_grid, layout_html  # Bokeh is only imported when plots are asked for
+    for domain in ("kinematics", "kinetics"):
+        if html:
+            with open(f"{stem}_{domain}.html", "w", encoding="utf-8") as f:
+                f.write(layout_html(d, domain))
+            written.append(f"{stem}_{domain}.html")
+        if png:
+            # needs selenium and a browser driver, see bokeh.io.export_png
+            from bokeh.io import export_png
+            from bokeh.layouts import gridplot
+
+            grid = gridplot(layout_grid(d, domain), merge_tools=False, toolbar_options=dict(logo=None))
+            written.append(export_png(grid, filename=f"{stem}_{domain}.png"))
+    return written
+
+
+def _run(path, out_dir, html, png, full, keep, name):
+    """
+    Worker entry point: never raises, returns (path, files, error, seconds,
+    DataSet if `keep` else None)
+    """
+    start = time.perf_counter()
+    try:
+        d = load(path)
+        files = report(path, out_dir, html, png, full, d, name)
+        return path, files, None, time.perf_counter() - start, d if keep else None
+    except Exception:
+        return path, [], traceback.format_exc(limit=-1).strip(), time.perf_counter() - start, None
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Write Excel reports for a directory of Visual3D export archives.")
+    parser.add_argument("input", help="directory with measurement .zip files (searched recursively)")
+    parser.add_argument("-o", "--output", default="reports", help="output directory (default: %(default)s)")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--html", action="store_true", help="also write the kinematics and kinetics summary grids as HTML")
+    parser.add_argument("--full", action="store_true", help="add stats and per-parameter curve sheets to the workbook")
+    parser.add_argument("--cohort", metavar="DIR", help="also write all measurements as one Parquet dataset to DIR")
+    parser.add_argument("--store", metavar="DIR", help="also save the measurements to the store in DIR (see store.py)")
+    parser.add_argument("--similarity", metavar="DIR", help="also add the curves to the similarity index in DIR")
+    parser.add_argument("--pca", type=int, default=0, metavar="K", help="refit the index PCA with K components afterwards")
+    parser.add_argument("--norms", metavar="STATE", help="add the sessions to the norm builder state in STATE (.npz, see norms.py)")
+    parser.add_argument("--norm-trials", action="store_true", help="new norm state: one observation per trial, not per session")
+    parser.add_argument("--norm-files", metavar="DIR", help="write norm files of the updated state to DIR")
+    parser.add_argument("--png", action="store_true", help="also export the summary grids as PNG (needs selenium)")
+    args = parser.parse_args(argv)
+
+    paths = sorted(
+        os.path.join(root, name)
+        for root, _, files in os.walk(args.input)
+        for name in files
+        if name.lower().endswith(".zip")
+    )
+    if not paths:
+        print(f"No .zip files found in {args.input}", file=sys.stderr)
+        return 1
+    os.makedirs(args.output, exist_ok=True)
+
+    # outputs mirror the input folders, so same-named archives in different folders stay apart;
+    # names differing only in case would still collide on some file systems and are not processed
+    failed = {}
+    owners = {}
+    for path in paths:
+        name = output_stem(path, args.input)
+        owner = owners.setdefault(os.path.normcase(name).lower(), path)
+        if owner != path:
+            failed[path] = f"Output name {name} is already used by {owner}"
+    todo = [path for path in paths if path not in failed]
+
+    cohort = None
+    if args.cohort:
+        from cohort import CohortWriter
+
+        cohort = CohortWriter(args.cohort)
+    store = None
+    if args.store:
+        from store import MeasurementStore
+
+        store = MeasurementStore(args.store)
+    index = None
+    if args.similarity:
+        from similarity import CurveIndex
+
+        index = CurveIndex(args.similarity)
+    norms = None
+    if args.norms:
+        from norms import NormBuilder
+
+        norms = NormBuilder.load(args.norms) if os.path.exists(args.norms) else NormBuilder(trials=args.norm_trials)
+    keep = cohort is not None or store is not None or index is not None or norms is not None
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        futures = [
+            pool.submit(_run, path, args.output, args.html, args.png, args.full, keep, output_stem(path, args.input))
+            for path in todo
+        ]
+        for done, future in enumerate(as_completed(futures), 1):
+            path, _, error, seconds, d = future.result()
+            status = "ok" if error is None else "FAILED"
+            print(f"[{done}/{len(todo)}] {path}: {status} ({seconds:.1f} s)", file=sys.stderr)
+            if error is not None:
+                failed[path] = error
+                continue
+            if cohort is not None:
+                cohort.add(d)  # written out as they arrive, not collected first
+            if store is not None:
+                store.put(d)
+            if index is not None:
+                index.add(d)
+            if norms is not None:
+                norms.add(d)
+    if cohort is not None:
+        cohort.close()
+        print(f"\nCohort of {len(cohort)} measurements in {args.cohort}", file=sys.stderr)
+    if index is not None and args.pca:
+        index.fit_pca(args.pca)
+    if index is not None:
+        print(f"\n{len(index)} sessions in the similarity index {args.similarity}", file=sys.stderr)
+    if norms is not None:
+        norms.save(args.norms)
+        if args.norm_files:
+            norms.write_norm_files(args.norm_files)
+        print(f"\nNorms of {norms.sessions} sessions in {args.norms}", file=sys.stderr)
+
+    print(f"\n{len(paths) - len(failed)} of {len(paths)} archives processed, reports in {args.output}", file=sys.stderr)
+    for path, error in failed.items():
+        print(f"\n{path}\n{error}", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,344 @@
+"""
+Benchmarks of the processing pipeline, stage by stage.
+
+    python bench.py                          # Examples/Data1.zip and Data2.zip
+    python bench.py --trials 1 4 --params 1 3 --sessions 1 8
+    python bench.py --synthetic --trials 10 100  # synth.py archives of 50 and 500 trials
+    python bench.py --compare bench_results.jsonl
+
+Every case runs the stages below on `sessions` archives and measures them
+one at a time, each on fresh inputs prepared outside the measurement:
+
+    ingest       read_archive of the zip files
+    dataset      DataSet of the parsed tables
+    stats        stats tables of every parameter for the config phases
+    render       kinematics and kinetics summary grids as HTML
+    compare      comparison of all sessions, figure and stats of every parameter
+    export       Export.to_bytes
+    export_full  StreamExport.write with stats and curve sheets
+
+Larger inputs are derived from the example archives: `--trials` repeats the
+walking trials, `--params` repeats every curve parameter under new names
+(through a scaled copy of config.toml), and sessions differ by a small
+offset, so their keys differ. Curve values are kept, so stats and plots do
+the same work as on real data. With `--synthetic` the sessions are
+`synth.archive`s of 5 walking trials times `--trials` instead.
+
+Per stage the best and median wall time of `--repeat` runs are reported,
+then one more run measures memory: the peak resident set size (Linux; the
+process high-water mark elsewhere), the peak of traced allocations and the
+number of allocated blocks still alive at its end. Results are appended to
+`--output` as JSON lines with the commit and library versions, so runs can
+be compared.
+"""
+import numpy as np
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import zipfile
+from io import BytesIO
+
+from core import Config, DataCompare, DataSet, Export, StreamExport
+from ingest import read_archive
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+EXAMPLES = [os.path.join(HERE, "Examples", name) for name in ("Data1.zip", "Data2.zip")]
+STAGES = ("ingest", "dataset", "stats", "render", "compare", "export", "export_full")
+
+
+def scaled_config(params: int, path: str) -> str:
+    """
+    Write config.toml with every curve parameter repeated `params` times to
+    `path`; copy `j` is named "<name> (j)" and reads "<file> (j).txt".
+    """
+    import toml
+
+    config = toml.load(Config.file)
+    for domain in Config.domains:
+        items = []
+        for j in range(params):
+            for item in config[domain]:
+                if j:
+                    item = dict(item, name=f"{item['name']} ({j})")
+                    for k in ("left_file", "right_file", "norm_file"):
+                        item[k] = f"{os.path.splitext(item[k])[0]} ({j}).txt"
+                items.append(item)
+        config[domain] = items
+    with open(path, "w", encoding="utf-8") as f:
+        toml.dump(config, f)
+    return path
+
+
+def scale_archive(data: bytes, trials: int = 1, params: int = 1, offset: float = 0.0) -> bytes:
+    """
+    A copy of the export archive `data` with the walking trials of every
+    curve file repeated `trials` times and the curve files of every
+    parameter repeated `params` times (named as in `scaled_config`);
+    `offset` is added to all trial curves.
+    """
+    base = Config.load()
+    curve_files = {name for name, (_, item) in base.by_file.items() if name != item["norm_file"]}
+    output = BytesIO()
+    with zipfile.ZipFile(BytesIO(data)) as src, zipfile.ZipFile(output, "w", zipfile.ZIP_DEFLATED) as dst:
+        for member in src.namelist():
+            name = os.path.basename(member)
+            if name not in base.required_files():
+                continue
+            raw = src.read(member)
+            if name in curve_files and (trials > 1 or offset):
+                raw = _scale_curves(raw, trials, offset)
+            copies = params if name in base.by_file else 1
+            stem = os.path.splitext(name)[0]
+            for j in range(copies):
+                dst.writestr(name if j == 0 else f"{stem} ({j}).txt", raw)
+    return output.getvalue()
+
+
+def _scale_curves(raw: bytes, trials: int, offset: float) -> bytes:
+    rows = [line.split("\t") for line in raw.decode("utf-8").splitlines()]
+    walking = [i for i, col in enumerate(rows[0]) if i and "Static" not in col]
+    static = [i for i in range(1, len(rows[0])) if i not in walking]
+    out = []
+    for r, row in enumerate(rows):
+        cells = [row[0]]
+        for copy in range(trials):
+            for i in walking:
+                cell = row[i] if i < len(row) else ""
+                if r == 0 and copy:
+                    cell = cell.replace(".c3d", f" r{copy}.c3d")
+                elif r >= 5 and cell and offset:
+                    cell = f"{float(cell) + offset:.2f}"
+                cells.append(cell)
+        cells += [row[i] if i < len(row) else "" for i in static]
+        out.append("\t".join(cells))
+    return ("\n".join(out) + "\n").encode("utf-8")
+
+
+def make_case(trials: int = 1, params: int = 1, sessions: int = 2, config_dir: str = None, synthetic: bool = False):
+    """Archives (list of bytes) and config of one benchmark case"""
+    c = Config.load()
+    if params > 1:
+        c = Config.load(scaled_config(params, os.path.join(config_dir, f"config_p{params}.toml")))
+    if synthetic:
+        from synth import archive
+
+        return [scale_archive(archive(trials=5 * trials, session=i), 1, params) for i in range(sessions)], c
+    examples = []
+    for path in EXAMPLES:
+        with open(path, "rb") as f:
+            examples.append(f.read())
+    archives = [
+        scale_archive(examples[i % len(examples)], trials, params, offset=0.01 * (i // len(examples)))
+        for i in range(sessions)
+    ]
+    return archives, c
+
+
+def stage_runners(archives: list, c: Config) -> dict:
+    """Stage name -> (setup, run); `run(setup())` is what is measured"""
+
+    def parse():
+        return [read_archive(data, c.required_files(), {c.info["file"]}) for data in archives]
+
+    def dataset(i, tables):
+        d = DataSet(tables, f"bench-{i}")
+        for domain in Config.domains:
+            d.curves(domain)  # built on first use otherwise, and charged to the later stage
+        return d
+
+    def datasets(tables):
+        return [dataset(i, t) for i, t in enumerate(tables)]
+
+    def build():
+        return datasets(parse())
+
+    def stats_maps(datasets):
+        return [
+            {
+                param: {"df_stats": dfs.stats_table(c.phases), "comments": ""}
+                for domain in Config.domains
+                for param, dfs in getattr(d, domain).items()
+            }
+            for d in datasets
+        ]
+
+    def render(datasets):
+        from plots import layout_html
+
+        return [layout_html(d, domain) for d in datasets for domain in Config.domains]
+
+    def compare(datasets):
+        from plots import compare_figure
+
+        dc = DataCompare(datasets)
+        for domain in Config.domains:
+            for name in dc.params[domain]:
+                compare_figure(dc, domain, name).html()
+                dc.stats_table(domain, name, c.phases)
+
+    def export(datasets):
+        return [Export.to_bytes(d, stats) for d, stats in zip(datasets, stats_maps(datasets))]
+
+    def export_full(datasets):
+        for d, stats in zip(datasets, stats_maps(datasets)):
+            StreamExport.write(BytesIO(), d, stats, c.phases)
+
+    return {
+        "ingest": (lambda: None, lambda _: parse()),
+        "dataset": (parse, datasets),
+        "stats": (build, stats_maps),
+        "render": (build, render),
+        "compare": (build, compare),
+        "export": (build, export),
+        "export_full": (build, export_full),
+    }
+
+
+def _reset_peak_rss() -> bool:
+    # Linux: writing 5 to clear_refs resets VmHWM to the current RSS
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss_mb() -> float:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 1024  # bytes on macOS, KiB elsewhere
+
+
+def measure(setup, run, repeat: int = 5) -> dict:
+    """Best and median seconds of `repeat` runs, then memory of one traced run"""
+    times = []
+    run(setup())  # warm-up: imports, lazy module state
+    for _ in range(repeat):
+        state = setup()
+        start = time.perf_counter()
+        run(state)
+        times.append(time.perf_counter() - start)
+        del state
+
+    state = setup()
+    rss_reset = _reset_peak_rss()
+    rss_before = _peak_rss_mb()
+    tracemalloc.start()
+    run(state)
+    _, traced_peak = tracemalloc.get_traced_memory()
+    snapshot = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    rss_peak = _peak_rss_mb()
+    return {
+        "best_s": min(times),
+        "median_s": float(np.median(times)),
+        "peak_rss_mb": rss_peak,
+        "rss_growth_mb": rss_peak - rss_before,
+        "rss_exact": rss_reset,
+        "traced_peak_mb": traced_peak / 2**20,
+        # allocations still alive at the end of the run, by count
+        "live_blocks": sum(stat.count for stat in snapshot.statistics("filename")),
+    }
+
+
+def environment() -> dict:
+    import bokeh
+    import pandas as pd
+    import xlsxwriter
+
+    try:
+        commit = subprocess.run(
+            ["git", "-C", HERE, "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "bokeh": bokeh.__version__,
+        "xlsxwriter": xlsxwriter.__version__,
+    }
+
+
+def compare_runs(path: str, file=sys.stdout):
+    """Print best times of the last two runs in `path` per case and stage"""
+    with open(path) as f:
+        results = [json.loads(line) for line in f if line.strip()]
+    runs = sorted({r["run"] for r in results}, key=lambda run: min(r["env"]["time"] for r in results if r["run"] == run))
+    if len(runs) < 2:
+        print(f"{path} holds {len(runs)} run, nothing to compare", file=file)
+        return
+    old, new = ({(r["case"], r["stage"]): r for r in results if r["run"] == run} for run in runs[-2:])
+    print(f"{'case':<24}{'stage':<13}{'before':>10}{'after':>10}{'ratio':>8}", file=file)
+    for key in new:
+        if key in old:
+            before, after = old[key]["best_s"], new[key]["best_s"]
+            print(f"{key[0]:<24}{key[1]:<13}{before:>9.3f}s{after:>9.3f}s{after / before:>8.2f}", file=file)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark ingest, processing, stats, rendering and export.")
+    parser.add_argument("--trials", type=int, nargs="+", default=[1], help="trial multipliers (default: 1)")
+    parser.add_argument("--params", type=int, nargs="+", default=[1], help="parameter multipliers (default: 1)")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[2], help="session counts (default: 2)")
+    parser.add_argument("--synthetic", action="store_true", help="use synth.py archives instead of the examples")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES), help="stages to run (default: all)")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per stage (default: %(default)s)")
+    parser.add_argument("-o", "--output", default="bench_results.jsonl", help="results file, appended (default: %(default)s)")
+    parser.add_argument("--compare", metavar="FILE", help="only compare the last two runs in FILE")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare_runs(args.compare)
+        return 0
+
+    env = environment()
+    run_id = f"{env['time']}-{os.getpid()}"
+    print(f"{'case':<24}{'stage':<13}{'best':>9}{'median':>9}{'rss MB':>9}{'traced MB':>11}{'blocks':>9}")
+    with tempfile.TemporaryDirectory() as tmp, open(args.output, "a") as out:
+        for trials in args.trials:
+            for params in args.params:
+                for sessions in args.sessions:
+                    case = f"{'synth-' if args.synthetic else ''}t{trials}-p{params}-s{sessions}"
+                    archives, c = make_case(trials, params, sessions, tmp, args.synthetic)
+                    default_file = Config.file
+                    Config.file = c.path  # plots and exports call Config.load()
+                    try:
+                        runners = stage_runners(archives, c)
+                        for stage in args.stages:
+                            result = measure(*runners[stage], repeat=args.repeat)
+                            print(
+                                f"{case:<24}{stage:<13}{result['best_s']:>8.3f}s{result['median_s']:>8.3f}s"
+                                f"{result['peak_rss_mb']:>9.0f}{result['traced_peak_mb']:>11.1f}{result['live_blocks']:>9}",
+                                flush=True,
+                            )
+                            row = {"run": run_id, "case": case, "stage": stage, "trials": trials, "params": params}
+                            row.update(sessions=sessions, repeat=args.repeat, env=env, **result)
+                            out.write(json.dumps(row) + "\n")
+                    finally:
+                        Config.file = default_file
+    print(f"\nResults appended to {args.output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
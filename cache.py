@@ -0,0 +1,159 @@
+import hashlib
+import os
+import pickle
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    Thread-safe mapping that keeps at most `max_entries` items and evicts
+    the least recently used one first.
+
+    Streamlit serves every session from its own thread, so all access goes
+    through a lock.
+    """
+
+    def __init__(self, max_entries: int = 16):
+        self.max_entries = max(1, int(max_entries))
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._items:
+                return default
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+    def keys(self) -> list:
+        with self._lock:
+            return list(self._items)
+
+    def discard(self, key):
+        """Drop `key` from memory if present"""
+        with self._lock:
+            self._items.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+class ParseCache(LRUCache):
+    """
+    Processed measurements keyed by the content hash of the uploaded archive.
+
+    The in-memory tier is an LRU shared by all sessions. If `disk_dir` is
+    given, every entry is also pickled there, so a dataset evicted from
+    memory (or built before a server restart) is loaded back instead of
+    re-parsing the zip. Above `disk_mb`, the least recently used pickles
+    (by modification time, refreshed on every disk hit) are deleted.
+
+    Parameters
+    ----------
+    max_entries : int
+        Number of DataSets kept in memory.
+    disk_dir : str, optional
+        Directory of the on-disk tier; `None` keeps the cache in memory only.
+    disk_mb : float
+        Size limit of the on-disk tier in MB, 0 for no limit.
+    """
+
+    def __init__(self, max_entries: int = 8, disk_dir: str = None, disk_mb: float = 0):
+        super().__init__(max_entries)
+        self.disk_dir = disk_dir
+        self.disk_bytes = disk_mb * 2**20
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    @staticmethod
+    def digest(data: bytes, salt: bytes = b"") -> str:
+        """Content address of an archive; `salt` ties it to the config used."""
+        h = hashlib.sha256(salt)
+        h.update(data)
+        return h.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.pkl")
+
+    def get(self, key, default=None):
+        value = super().get(key)
+        if value is not None or not self.disk_dir:
+            return default if value is None else value
+        try:
+            with open(self._path(key), "rb") as f:
+                value = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+            return default
+        try:
+            os.utime(self._path(key))  # recently used, evicted last
+        except OSError:
+            pass
+        super().put(key, value)  # promote to the memory tier
+        return value
+
+    def put(self, key, value):
+        super().put(key, value)
+        if not self.disk_dir:
+            return
+        # write to a temp file first so readers never see a partial pickle
+        tmp = f"{self._path(key)}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, self._path(key))
+        except (OSError, pickle.PicklingError, TypeError, AttributeError):
+            # the disk tier is optional: a value that cannot be written stays in memory only
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            return
+        if self.disk_bytes:
+            self.evict_disk(keep=key)
+
+    def evict_disk(self, keep=None):
+        """Delete the least recently used pickles until the disk tier fits in `disk_mb`"""
+        entries = []
+        with os.scandir(self.disk_dir) as it:
+            for entry in it:
+                if entry.name.endswith(".pkl"):
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue  # deleted meanwhile
+                    entries.append((stat.st_mtime_ns, stat.st_size, entry.name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.disk_bytes:
+                break
+            if name == f"{keep}.pkl":
+                continue
+            try:
+                os.remove(os.path.join(self.disk_dir, name))
+            except OSError:
+                continue
+            total -= size
+
+    def get_or_build(self, data: bytes, build, salt: bytes = b""):
+        """Return the cached value for `data`, calling `build(data, key)` on a miss."""
+        key = self.digest(data, salt)
+        value = self.get(key)
+        if value is None:
+            value = build(data, key)
+            self.put(key, value)
+        return value
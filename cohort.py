@@ -0,0 +1,193 @@
+"""
+Cohort export: many measurements as long-format tables for research.
+
+    with CohortWriter("cohort") as writer:
+        for d in datasets:
+            writer.add(d)
+
+writes a Parquet dataset readable with `pandas.read_parquet("cohort/curves")`
+or `pyarrow.dataset.dataset("cohort/curves", partitioning="hive")`:
+
+    cohort/sessions/part-0.parquet
+    cohort/ts/part-0.parquet
+    cohort/gps/part-0.parquet
+    cohort/curves/domain=kinematics/part-0.parquet
+    cohort/curves/domain=kinetics/part-0.parquet
+    cohort/summary.xlsx
+
+Every table starts with the session columns (`session`, `subject`, `date`,
+`condition`, `subsession`). Measurements are converted one at a time and
+written out in row groups, so memory does not grow with the cohort; only the
+one-row-per-session summary is kept until `close`. pyarrow comes with
+Streamlit.
+"""
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import os
+import tempfile
+import zipfile
+from io import BytesIO
+
+from core import Config, DataSet, SIDES
+from instrument import timed
+
+SESSION = [
+    ("session", pa.string()),
+    ("subject", pa.string()),
+    ("date", pa.string()),
+    ("condition", pa.string()),
+    ("subsession", pa.string()),
+]
+SCHEMAS = {
+    "sessions": pa.schema(SESSION + [("title", pa.string())]),
+    "ts": pa.schema(SESSION + [("parameter", pa.string()), ("side", pa.string()), ("value", pa.float64())]),
+    "gps": pa.schema(SESSION + [("metric", pa.string()), ("side", pa.string()), ("value", pa.float64())]),
+    "curves": pa.schema(
+        SESSION + [("parameter", pa.string()), ("side", pa.string()), ("cycle", pa.int16()), ("value", pa.float64())]
+    ),
+}
+
+
+def session_columns(d: DataSet) -> dict:
+    """The session columns of `d`, from its Info.txt metadata"""
+    return {"session": d.key, **d.session_fields()}
+
+
+def long_tables(d: DataSet):
+    """
+    Yield (table, partition, DataFrame) for one measurement.
+
+    `partition` is the hive directory below the table (`"domain=kinetics"`)
+    or "" for unpartitioned tables.
+    """
+    session = session_columns(d)
+    yield "sessions", "", pd.DataFrame([{**session, "title": d.title}])
+
+    ts = d.ts.melt(id_vars="Parameters", value_vars=["Both", "Left", "Right"], var_name="side").dropna()
+    ts = ts.rename(columns={"Parameters": "parameter"})
+    yield "ts", "", ts.assign(**session)
+
+    overall, gvs = d.gps
+    gps = gvs.melt(id_vars="Metric", value_vars=["Left", "Right"], var_name="side").rename(columns={"Metric": "metric"})
+    gps = pd.concat([pd.DataFrame([{"metric": "Gait Profile Score", "side": "Both", "value": overall}]), gps])
+    yield "gps", "", gps.dropna().assign(**session)
+
+    for domain in Config.domains:
+        cv = getattr(d, domain)
+        n_params, n_sides, n_samples = cv.means.shape
+        curves = pd.DataFrame(
+            {
+                "parameter": np.repeat(list(cv), n_sides * n_samples),
+                "side": np.tile(np.repeat(SIDES, n_samples), n_params),
+                "cycle": np.tile(cv.cycle, n_params * n_sides),
+                "value": cv.means.ravel(),
+            }
+        )
+        yield "curves", f"domain={domain}", curves.assign(**session)
+
+
+def summary_row(d: DataSet) -> dict:
+    """One wide row per session for the xlsx summary: TS parameters, GPS and GVS"""
+    row = {**session_columns(d), "title": d.title}
+    for param, *values in d.ts[["Parameters", "Both", "Left", "Right"]].itertuples(index=False):
+        for side, value in zip(("", " L", " R"), values):
+            if value == value:  # skip NaN
+                row[f"{param}{side}"] = value
+    overall, gvs = d.gps
+    row["GPS"] = overall
+    for metric, left, right in gvs[["Metric", "Left", "Right"]].itertuples(index=False):
+        row[f"{metric} L"], row[f"{metric} R"] = left, right
+    return row
+
+
+class CohortWriter:
+    """
+    Incremental writer of the cohort tables, see the module docstring.
+
+    Parameters
+    ----------
+    out_dir : str
+        Directory of the dataset, created if missing.
+    row_group_size : int
+        Rows buffered per table and partition before they are written as
+        one Parquet row group.
+    xlsx : bool
+        Also write summary.xlsx, one row per session.
+    """
+
+    def __init__(self, out_dir: str, row_group_size: int = 100_000, xlsx: bool = True):
+        self.out_dir = out_dir
+        self.row_group_size = row_group_size
+        self.xlsx = xlsx
+        self.written = []
+        self._writers = {}  # (table, partition) -> ParquetWriter
+        self._buffers = {}  # (table, partition) -> list of pyarrow.Table
+        self._summary = []
+        self.sessions = 0
+        os.makedirs(out_dir, exist_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.sessions
+
+    def add(self, d: DataSet):
+        """Append one measurement to every table"""
+        for table, partition, df in long_tables(d):
+            key = (table, partition)
+            self._buffers.setdefault(key, []).append(
+                pa.Table.from_pandas(df, schema=SCHEMAS[table], preserve_index=False)
+            )
+            if sum(t.num_rows for t in self._buffers[key]) >= self.row_group_size:
+                self._flush(key)
+        if self.xlsx:
+            self._summary.append(summary_row(d))
+        self.sessions += 1
+
+    def _flush(self, key):
+        chunks = self._buffers.pop(key, [])
+        if not chunks:
+            return
+        if key not in self._writers:
+            directory = os.path.join(self.out_dir, *filter(None, key))
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, "part-0.parquet")
+            self._writers[key] = pq.ParquetWriter(path, SCHEMAS[key[0]], compression="zstd")
+            self.written.append(path)
+        self._writers[key].write_table(pa.concat_tables(chunks), row_group_size=self.row_group_size)
+
+    def close(self) -> list:
+        """Write what is buffered, finish all files and return their paths"""
+        for key in list(self._buffers):
+            self._flush(key)
+        for writer in self._writers.values():
+            writer.close()
+        self._writers = {}
+        if self.xlsx and self._summary:
+            path = os.path.join(self.out_dir, "summary.xlsx")
+            with pd.ExcelWriter(path, engine="xlsxwriter") as writer:
+                pd.DataFrame(self._summary).to_excel(writer, sheet_name="Sessions", index=False)
+            self.written.append(path)
+            self._summary = []
+        return self.written
+
+
+@timed("export.cohort")
+def to_zip(datasets) -> bytes:
+    """Cohort dataset of `datasets` as a zip archive, for a download button"""
+    with tempfile.TemporaryDirectory() as tmp:
+        with CohortWriter(tmp) as writer:
+            for d in datasets:
+                writer.add(d)
+        output = BytesIO()
+        with zipfile.ZipFile(output, "w", zipfile.ZIP_STORED) as zf:  # Parquet is compressed already
+            for path in writer.written:
+                zf.write(path, os.path.relpath(path, tmp))
+        return output.getvalue()
@@ -0,0 +1,1133 @@
+"""
+Streamlit-free core of the dashboard: configuration, processing of the
+exported measurement files, phase statistics and Excel export.
+
+Nothing here imports Streamlit or Bokeh, so batch workers and scripts can
+use it cheaply; the UI lives in classes.py and plotting in plots.py.
+"""
+import numpy as np
+import pandas as pd
+import toml
+import xlsxwriter
+
+import hashlib
+import os
+import threading
+import uuid
+from collections.abc import Mapping
+from io import BytesIO
+
+from instrument import timed
+
+
+class Config:
+    """
+    Parsed and validated config.toml with lookup indexes.
+
+    Use `Config.load()`: it returns the same instance until the file's
+    modification time or size changes, so callers can ask for it on every
+    Streamlit rerun and still pick up edits without a restart.
+
+    Attributes
+    ----------
+    digest : bytes
+        SHA-256 of the file, salts cache keys.
+    by_file : dict of str -> (str, dict)
+        Curve file name -> (domain, config entry).
+    by_name : dict of str -> dict of str -> dict
+        Domain -> parameter name -> config entry.
+    grid_positions : dict of str -> dict of str -> (int, int)
+        Domain -> parameter name -> (row, column) in the summary grid.
+    """
+
+    file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "config.toml")
+    domains = ("kinematics", "kinetics")
+    # section -> keys read by the code, checked before anything else
+    sections = {
+        "info": ("file",),
+        "temporal": ("file",),
+        "gps": ("file", "names", "params"),
+        "kinematics": (),
+        "kinetics": (),
+        "standard": ("layout_kinematics", "layout_kinetics"),
+        "colors": ("left", "right", "mean", "static"),
+        "size": ("height", "width", "small_height", "small_width"),
+        "cache": ("max_entries", "disk_dir", "disk_mb", "html_entries", "compare_entries"),
+        "store": ("dir",),
+        "similarity": ("dir",),
+        "memory": ("session_mb", "total_mb", "plot_state_entries", "spill_dir"),
+        "diagnostics": ("enabled",),
+        "phases": ("names", "ranges"),
+    }
+    _loaded = {}  # path -> ((mtime_ns, size), Config)
+
+    @classmethod
+    def load(cls, file: str = None) -> "Config":
+        """Parsed config, read again only if the file changed since the last call"""
+        file = file or cls.file
+        stat = os.stat(file)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        loaded = cls._loaded.get(file)
+        if loaded is None or loaded[0] != stamp:
+            loaded = (stamp, cls(file))
+            cls._loaded[file] = loaded
+        return loaded[1]
+
+    def __init__(self, file: str = None):
+        self.path = file or self.file
+        with open(self.path, "rb") as f:
+            raw = f.read()
+        self.digest = hashlib.sha256(raw).digest()  # salts cache keys
+        self.config = toml.loads(raw.decode("utf-8"))
+        self.validate()
+        self.info = self.config["info"]
+        self.temporal = self.config["temporal"]
+        self.gps = self.config["gps"]
+        self.kinematics = self.config["kinematics"]
+        self.kinetics = self.config["kinetics"]
+        self.layout_kinematics = self.config["standard"]["layout_kinematics"]
+        self.layout_kinetics = self.config["standard"]["layout_kinetics"]
+        self.colors = self.config["colors"]
+        self.size = self.config["size"]
+        self.cache = self.config["cache"]
+        self.store = self.config["store"]
+        self.similarity = self.config["similarity"]
+        self.diagnostics = self.config["diagnostics"]
+        self.memory = self.config["memory"]
+        keys = self.config["phases"]["names"]
+        values = self.config["phases"]["ranges"]
+        self.phases = dict(zip(keys, values))
+        # lookup indexes
+        self.by_file = {}
+        self.by_name = {}
+        self.grid_positions = {}
+        for domain in self.domains:
+            self.by_name[domain] = {item["name"]: item for item in getattr(self, domain)}
+            for item in getattr(self, domain):
+                for k in ("left_file", "right_file", "norm_file"):
+                    self.by_file[item[k]] = (domain, item)
+            self.grid_positions[domain] = {
+                name: (i, j)
+                for i, row in enumerate(getattr(self, f"layout_{domain}"))
+                for j, name in enumerate(row)
+                if name
+            }
+
+    def validate(self):
+        """Raise ValueError listing every problem found in the parsed config"""
+        config = self.config
+        errors = []
+        for section, keys in self.sections.items():
+            if section not in config:
+                errors.append(f"missing section [{section}]")
+            else:
+                errors += [f"[{section}] lacks {key}" for key in keys if key not in config[section]]
+        if errors:  # the checks below need these
+            raise ValueError(f"Invalid {self.path}: " + "; ".join(errors))
+        for domain in self.domains:
+            names = set()
+            for i, item in enumerate(config[domain]):
+                missing = [k for k in ("name", "left_file", "right_file", "norm_file", "y_axis") if k not in item]
+                if missing:
+                    errors.append(f"{domain}[{i}] lacks {', '.join(missing)}")
+                elif item["name"] in names:
+                    errors.append(f"{domain}: duplicate name {item['name']!r}")
+                elif len(item["y_axis"]) != 2:
+                    errors.append(f"{domain}: y_axis of {item['name']!r} must be [min, max]")
+                names.add(item.get("name"))
+            layout = config["standard"][f"layout_{domain}"]
+            if len({len(row) for row in layout}) > 1:
+                errors.append(f"layout_{domain}: rows differ in length")
+            for name in {name for row in layout for name in row if name} - names:
+                errors.append(f"layout_{domain}: unknown parameter {name!r}")
+        gps = config["gps"]
+        if len(gps["names"]) != len(gps["params"]):
+            errors.append("gps: names and params differ in length")
+        for name in set(gps["params"]) - {item.get("name") for item in config["kinematics"]}:
+            errors.append(f"gps: unknown kinematics parameter {name!r}")
+        phases = config["phases"]
+        if len(phases["names"]) != len(phases["ranges"]):
+            errors.append("phases: names and ranges differ in length")
+        for name, frames in zip(phases["names"], phases["ranges"]):
+            if len(frames) != 2 or not 0 <= frames[0] <= frames[1] <= 100:
+                errors.append(f"phases: range of {name!r} must be [start, end] within 0..100")
+        if errors:
+            raise ValueError(f"Invalid {self.path}: " + "; ".join(errors))
+
+    def required_files(self) -> set:
+        """Names of all exported files referenced by the config"""
+        return {self.info["file"], self.temporal["file"], self.gps["file"], *self.by_file}
+
+
+SIDES = ("Left", "Right")
+STATS = ("Max", "Min", "ROM")
+STAT_COLUMNS = [f"{prefix} {stat}" for prefix in ("L", "R", "Δ") for stat in STATS]
+
+
+class Param:
+    """
+    Metadata of one gait parameter and lazy DataFrame views of its curves.
+
+    The curves themselves live in the parent `Curves` arrays; every `df_*`
+    property builds a small DataFrame on access, so nothing is stored per
+    parameter besides these few fields.
+    """
+
+    __slots__ = ("curves", "index", "name", "y_axis", "y_label", "x_label")
+
+    def __init__(self, curves, index, name, y_axis, y_label=None, x_label=None):
+        self.curves = curves
+        self.index = index
+        self.name = name
+        self.y_axis = y_axis
+        self.y_label = y_label or "Angle, degrees"
+        self.x_label = x_label or "Gait cycle, %"
+
+    def side_frame(self, side: int) -> pd.DataFrame:
+        """Gait cycle, every trial and the mean of one side (0 left, 1 right)"""
+        cv = self.curves
+        names = cv.trial_names[self.index][side]
+        data = {"Gait cycle": cv.cycle}
+        data.update(zip(names, cv.trials[self.index, side, : len(names)]))
+        data[f"{SIDES[side]} Mean"] = cv.means[self.index, side]
+        return pd.DataFrame(data)
+
+    @property
+    def df_left(self) -> pd.DataFrame:
+        return self.side_frame(0)
+
+    @property
+    def df_right(self) -> pd.DataFrame:
+        return self.side_frame(1)
+
+    @property
+    def df_both(self) -> pd.DataFrame:
+        cv = self.curves
+        return pd.DataFrame(
+            {
+                "Gait cycle": cv.cycle,
+                "Left Mean": cv.means[self.index, 0],
+                "Right Mean": cv.means[self.index, 1],
+            }
+        )
+
+    @property
+    def df_norm(self):
+        cv = self.curves
+        if not cv.has_norm[self.index]:
+            return None
+        return pd.DataFrame(
+            {
+                "Gait cycle": cv.cycle,
+                "Mean": cv.norms[self.index, 0],
+                "SD": cv.norms[self.index, 1],
+            }
+        )
+
+    @property
+    def df_stats(self) -> pd.DataFrame:
+        return self.stats_table({"Full Cycle": (0, 100)})
+
+    def stats_values(self, frames) -> np.ndarray:
+        """
+        (phase, 9) array of the `STAT_COLUMNS` for each (% start, % end)
+        pair: max, min and ROM of both mean curves and their left-right
+        differences, rounded to 0.1; NaN for a phase that starts after it
+        ends or covers no samples.
+        """
+        left, right = self.curves.phase_stats(frames, self.index)  # (phase, stat) each
+        return np.concatenate([left, right, left - right], axis=1)
+
+    def stats_table(self, phases: dict) -> pd.DataFrame:
+        """Stats table for all phases: {'Full Cycle': (0, 100),}"""
+        table = pd.DataFrame(
+            {
+                "Phase": list(phases),
+                "% Start": [frames[0] for frames in phases.values()],
+                "% End": [frames[1] for frames in phases.values()],
+            }
+        )
+        table[STAT_COLUMNS] = self.stats_values(list(phases.values()))
+        return table
+
+
+def _unique_names(names: list) -> list:
+    """`names` with repeats suffixed " (2)", " (3)", ..., so trials stay apart as frame columns"""
+    seen, out = set(names), []
+    counts = {}
+    for name in names:
+        counts[name] = counts.get(name, 0) + 1
+        unique = name
+        if counts[name] > 1:
+            n = counts[name]
+            while f"{name} ({n})" in seen:
+                n += 1
+            unique = f"{name} ({n})"
+            seen.add(unique)
+        out.append(unique)
+    return out
+
+
+class Curves(Mapping):
+    """
+    All curves of one domain (kinematics or kinetics) in stacked arrays.
+
+    Behaves as a read-only mapping of parameter name -> `Param`, in config
+    order. Side axis 0 is left, 1 is right; trials of a parameter that has
+    fewer than `T` of them are padded with NaN.
+
+    Attributes
+    ----------
+    trials : numpy.ndarray
+        (param, side, trial, sample) trial curves, Static included.
+    dynamic : numpy.ndarray
+        (param, side, trial) bool, True for walking trials (not Static, not padding).
+    means : numpy.ndarray
+        (param, side, sample) mean over walking trials.
+    norms : numpy.ndarray
+        (param, 2, sample) normative mean and SD, NaN without a norm file.
+    has_norm : numpy.ndarray
+        (param,) bool
+    trial_names : list of (list of str, list of str)
+        Left and right trial names per parameter.
+    cycle : numpy.ndarray
+        Gait cycle, % (0..sample-1).
+    """
+
+    __slots__ = ("params", "trials", "dynamic", "means", "norms", "has_norm", "trial_names", "cycle", "_tables")
+
+    def __init__(self, trials, dynamic, norms, has_norm, trial_names, meta):
+        self.trials = trials
+        self.dynamic = dynamic
+        self.norms = norms
+        self.has_norm = has_norm
+        self.trial_names = trial_names
+        self.cycle = np.arange(trials.shape[-1])
+        self._tables = None  # sparse tables for range max/min, built on first query
+        # mean over walking trials, NaN where a sample has no valid trial
+        valid = dynamic[..., None] & ~np.isnan(trials)
+        count = valid.sum(axis=2)
+        total = np.where(valid, trials, 0.0).sum(axis=2)
+        self.means = np.divide(total, count, out=np.full(total.shape, np.nan), where=count > 0)
+        # y_axis is a list of min and max values for the y-axis
+        lo = np.fmin.reduce(self.means, axis=(1, 2), initial=np.inf)
+        hi = np.fmax.reduce(self.means, axis=(1, 2), initial=-np.inf)
+        self.params = {}
+        for i, item in enumerate(meta):
+            y_axis = [min(lo[i], item["y_axis"][0]), max(hi[i], item["y_axis"][1])]
+            self.params[item["name"]] = Param(self, i, item["name"], y_axis, item.get("y_label"), item.get("x_label"))
+
+    @classmethod
+    @timed("core.curves")
+    def from_tables(cls, items: list, d: dict):
+        """
+        Stack the curve files of the config `items` found in `d`.
+
+        Parameters missing a left or right file are skipped.
+        """
+        items = [item for item in items if item["left_file"] in d and item["right_file"] in d]
+        tables = [(d[item["left_file"]], d[item["right_file"]]) for item in items]
+        n_trials = max((t.values.shape[1] for pair in tables for t in pair), default=0)
+        n_samples = max((t.values.shape[0] for pair in tables for t in pair), default=0)
+        shape = (len(items), 2)
+        trials = np.full(shape + (n_trials, n_samples), np.nan)
+        dynamic = np.zeros(shape + (n_trials,), dtype=bool)
+        norms = np.full((len(items), 2, n_samples), np.nan)
+        has_norm = np.zeros(len(items), dtype=bool)
+        trial_names = []
+        for i, (item, pair) in enumerate(zip(items, tables)):
+            names = []
+            for side, table in enumerate(pair):
+                rows, cols = table.values.shape
+                trials[i, side, :cols, :rows] = table.values.T
+                side_names = [col.replace("Gait ", "").replace(".c3d", "") for col in table.columns]
+                dynamic[i, side, :cols] = [name != "Static" for name in side_names]  # no Static for e.g. Moment
+                names.append(_unique_names(side_names))
+            trial_names.append(tuple(names))
+            norm = d.get(item["norm_file"])
+            if norm is not None:
+                norms[i, :, : norm.values.shape[0]] = norm.values[:, :2].T
+                has_norm[i] = True
+        return cls(trials, dynamic, norms, has_norm, trial_names, items)
+
+    def range_tables(self):
+        """
+        Sparse tables of the mean curves for O(1) range max/min queries.
+
+        Level k of each (level, param, side, sample) array holds the max
+        (min) of the 2**k samples starting at each position; NaN is skipped.
+        """
+        if self._tables is None:
+            n = self.means.shape[-1]
+            levels = max(1, n.bit_length())
+            tmax = np.full((levels,) + self.means.shape, np.nan)
+            tmin = np.full((levels,) + self.means.shape, np.nan)
+            tmax[0] = tmin[0] = self.means
+            for k in range(1, levels):
+                half, span = 1 << (k - 1), n - (1 << k) + 1
+                tmax[k, ..., :span] = np.fmax(tmax[k - 1, ..., :span], tmax[k - 1, ..., half : half + span])
+                tmin[k, ..., :span] = np.fmin(tmin[k - 1, ..., :span], tmin[k - 1, ..., half : half + span])
+            self._tables = (tmax, tmin)
+        return self._tables
+
+    def phase_stats(self, frames, index=slice(None)) -> np.ndarray:
+        """
+        Max, min and ROM of the mean curves for many phases in one pass.
+
+        Parameters
+        ----------
+        frames : sequence of (float, float)
+            (% start, % end) of each phase, both inclusive.
+        index : int or slice
+            Parameter(s) to query, all by default.
+
+        Returns
+        -------
+        numpy.ndarray
+            (param, side, phase, stat) with stats in `STATS` order, rounded
+            to 0.1 like the report tables; the param axis is dropped for an
+            int `index`.
+        """
+        tmax, tmin = self.range_tables()
+        n = self.means.shape[-1]
+        frames = np.array(frames, dtype=np.float64).reshape(-1, 2)
+        # samples are at whole percents, so [10.5, 60.5] covers 11..60
+        with np.errstate(invalid="ignore"):
+            start = np.maximum(np.ceil(frames[:, 0]), 0)
+            end = np.minimum(np.floor(frames[:, 1]), n - 1)
+            valid = end >= start  # False for NaN, start after end or out of range
+        start = np.where(valid, start, 0).astype(np.intp)
+        end = np.where(valid, end, 0).astype(np.intp)
+        k = np.log2(end - start + 1).astype(np.intp)
+        other = end - (1 << k) + 1
+        # advanced indices put the phase axis first: (phase, param, side)
+        mx = np.fmax(tmax[k, ..., start][:, index], tmax[k, ..., other][:, index])
+        mn = np.fmin(tmin[k, ..., start][:, index], tmin[k, ..., other][:, index])
+        mx, mn = np.round(mx, 1), np.round(mn, 1)
+        out = np.stack([mx, mn, np.round(mx - mn, 1)], axis=-1)
+        out[~valid] = np.nan
+        return np.moveaxis(out, 0, -2)
+
+    def gait_profile(self, names: list):
+        """
+        Gait Variable and Gait Profile Scores (Baker et al., 2009) of every
+        trial, from the curves of the `names` parameters and their norms.
+
+        A GVS is the RMS difference between a trial curve and the normative
+        mean over the gait cycle; a GPS is the RMS of the GVS it combines.
+        Left and right trials are paired by position, as Visual3D exports
+        them.
+
+        Returns
+        -------
+        gvs : numpy.ndarray
+            (param, side, trial), NaN for Static trials, padding and
+            parameters missing or without a norm.
+        gps : numpy.ndarray
+            (side, trial) GPS of each side.
+        overall : numpy.ndarray
+            (trial,) GPS of both sides together.
+        """
+        found = np.array([name in self.params for name in names], dtype=bool)
+        index = np.array([self.params[name].index for name in names if name in self.params], dtype=np.intp)
+        gvs = np.full((len(names), 2, self.trials.shape[2]), np.nan)  # missing parameters stay NaN
+        if len(index):
+            diff = self.trials[index] - self.norms[index, :1, None]  # (param, side, trial, sample)
+            valid = ~np.isnan(diff)
+            count = valid.sum(axis=-1)
+            sq = np.where(valid, diff * diff, 0.0).sum(axis=-1)
+            scores = np.sqrt(np.divide(sq, count, out=np.full(sq.shape, np.nan), where=count > 0))
+            scores[~self.has_norm[index]] = np.nan
+            scores[:, ~self.dynamic[index].all(axis=0)] = np.nan  # (side, trial) walking in every parameter
+            gvs[found] = scores
+        with np.errstate(invalid="ignore"):
+            gps = np.sqrt(np.mean(gvs * gvs, axis=0))
+            overall = np.sqrt(np.mean(gvs * gvs, axis=(0, 1)))
+        return gvs, gps, overall
+
+    def __getitem__(self, name) -> Param:
+        return self.params[name]
+
+    def __iter__(self):
+        return iter(self.params)
+
+    def __len__(self):
+        return len(self.params)
+
+
+class DataSet:
+    """
+    Load, process and organize gait analysis data for visualization.
+
+    This class takes parsed tables for various exported files
+    (metadata, temporal/spatial parameters, gait profile scores, kinematics)
+    and produces ready-to-plot structures
+
+    Parameters
+    ----------
+    d : mapping of str -> ingest.V3DTable
+        Mapping from expected file identifiers (e.g. `"Info.txt"`, 
+        `"Temporal Distance.txt"`, kinematics filenames) to their parsed
+        contents (see `ingest.read_archive`). With an `ingest.LazyArchive`
+        the curve files of a domain are only read when it is first used.
+
+    key : str, optional
+        Stable identity of the measurement, e.g. the archive hash from
+        `ParseCache.digest`; a random one is used if omitted.
+
+    archive : str, optional
+        Hash of the archive alone, without the config salt; `key` if omitted.
+
+    Attributes
+    ----------
+    key : str
+        Identity used in cache keys.
+
+    archive : str
+        Identity of the session across config edits, used by the
+        persistent store and the similarity index.
+
+    config : str
+        Hex digest of the config the curves were built with.
+
+    kinematics : Curves
+        Mapping of gait parameter name -> `Param`, backed by stacked arrays
+        of all trial, mean and normative curves (see `Curves`). Built on
+        first access, see `curves`.
+
+    kinetics : Curves
+        Same as `kinematics` for moments, powers and GRF.
+
+    info : pandas.DataFrame
+        Subject metadata table with columns `["Metadata", "Value"]`,
+        extracted from the Info file (name, date, test condition, etc.).
+
+    ts : pandas.DataFrame
+        Temporal and spatial parameters (speed, cadence, step length, stance %, etc.),
+        organized in a tidy table with columns `["Parameters", "Both", "Left", "Right"]`.
+
+    gps : tuple of (float, pandas.DataFrame)
+        - Overall Gait Profile Score (mean across metrics)  
+        - Per-metric Gait Variable Score summary as a DataFrame with columns
+          `["Metric", "Left", "Right"]`.
+        Read from MAP.txt, or computed from the kinematics if it is missing
+        (see `gps_from_curves`).
+    """
+
+    @timed("core.DataSet")
+    def __init__(self, d: dict, key: str = None, archive: str = None):
+        c = Config.load()
+        self.key = key or uuid.uuid4().hex  # identity for caches, content hash of the archive if known
+        self.archive = archive or self.key
+        self.config = c.digest.hex()
+        if c.info['file'] not in d:
+            raise FileNotFoundError(f"File {c.info['file']} not found")
+        self.process_info(d[c.info['file']])
+        if c.temporal['file'] not in d:
+            cols = ["Parameters", "Both", "Left", "Right"]
+            self.ts = pd.DataFrame([{c: np.nan for c in cols}])            
+        else:
+            self.ts = self.process_ts(d[c.temporal['file']])
+        # curves are built per domain on first use, with the config of now
+        self._tables = d
+        self._items = {domain: getattr(c, domain) for domain in Config.domains}
+        self._curves = {}
+        self._lock = threading.Lock()
+        if c.gps['file'] not in d:
+            self.gps = self.gps_from_curves()  # no Visual3D MAP export
+        else:
+            self.gps = self.process_map(d[c.gps['file']])
+
+    @classmethod
+    def from_parts(
+        cls, key, title, info, ts, gps, kinematics, kinetics, archive=None, config="", tables=None, items=None
+    ) -> "DataSet":
+        """
+        DataSet from already processed parts, e.g. read back from
+        `store.MeasurementStore`. A domain whose Curves is None is built
+        on first use from `tables` with the config entries `items[domain]`.
+        """
+        d = cls.__new__(cls)
+        d.key, d.title, d.info, d.ts, d.gps = key, title, info, ts, gps
+        d.archive, d.config = archive or key, config
+        d._curves = {domain: cv for domain, cv in zip(Config.domains, (kinematics, kinetics)) if cv is not None}
+        built = len(d._curves) == len(Config.domains)
+        d._tables, d._items = (None, None) if built else (tables, items)
+        d._lock = threading.Lock()
+        return d
+
+    def __getstate__(self):
+        with self._lock:
+            state = self.__dict__.copy()  # a LazyArchive pickles as its zip bytes
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        state.setdefault("archive", state["key"])  # pickled before the store keyed by archive
+        state.setdefault("config", "")
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def curves(self, domain: str) -> Curves:
+        """
+        The `Curves` of `domain`, built from its files on first use; the
+        parsed tables are released once both domains are built.
+        """
+        cv = self._curves.get(domain)
+        if cv is None:
+            with self._lock:  # one build even if sessions sharing this DataSet ask at once
+                cv = self._curves.get(domain)
+                if cv is None:
+                    items = self._items[domain]
+                    files = [item[k] for item in items for k in ("left_file", "right_file", "norm_file")]
+                    lazy = hasattr(self._tables, "prefetch")  # an ingest.LazyArchive
+                    if lazy:
+                        self._tables.prefetch(files)
+                    cv = Curves.from_tables(items, self._tables)
+                    if lazy:
+                        self._tables.release(files)  # now stacked in cv
+                    self._curves[domain] = cv
+                    if len(self._curves) == len(Config.domains):
+                        self._tables = self._items = None
+        return cv
+
+    def unbuilt(self):
+        """
+        (zip bytes, {domain: config entries}) of the domains not built yet,
+        to save them without building; None if all are built or the
+        tables are not an `ingest.LazyArchive`.
+        """
+        with self._lock:
+            items = {domain: items for domain, items in (self._items or {}).items() if domain not in self._curves}
+            if not items or not hasattr(self._tables, "data"):
+                return None
+            return self._tables.data, items
+
+    @property
+    def kinematics(self) -> Curves:
+        return self.curves("kinematics")
+
+    @property
+    def kinetics(self) -> Curves:
+        return self.curves("kinetics")
+
+    def session_fields(self) -> dict:
+        """Subject, date, test condition and subsession from the Info.txt metadata"""
+        info = dict(zip(self.info["Metadata"], self.info["Value"]))
+        return {
+            "subject": f"{info.get('First Name', '')} {info.get('Last Name', '')}".strip(),
+            "date": info.get("Creation date", ""),
+            "condition": info.get("Test condition", ""),
+            "subsession": info.get("Subsession", ""),
+        }
+
+    def process_info(self, table):
+        # first header row holds the keys, first body row the values
+        dct = dict(zip(table.names, table.text[0]))
+        # check if there is the key "Folder Name", take the name of the last folder from the value and split into subsession and test condition
+        if "Folder Name" in dct:
+            dct["Subsession"], dct["Test condition"] = (dct["Folder Name"].split("\\")[-2]).split("_")
+            del dct["Folder Name"]
+        self.title = f"{dct['First Name']} {dct['Last Name']}, {dct['Creation date']}, {dct['Test condition']}"
+        self.info = pd.DataFrame(dct.items(), columns=['Metadata', 'Value'])
+
+    def process_ts(self, table):
+        dct = dict(zip(table.names, table.values[0].tolist()))
+        # values from QRC
+        leftright = {
+            "Step Length, cm": (round(dct['Left_Step_Length_Mean']*100, 0), round(dct['Right_Step_Length_Mean']*100, 0)),
+            "Step Time, s": (round(dct['Left_Step_Time_Mean'], 2), round(dct['Right_Step_Time_Mean'], 2)),
+            "Stance, %": (round(dct['Left_Stance_Time_Mean']/dct['Left_Cycle_Time_Mean'] * 100, 1), round(dct['Right_Stance_Time_Mean']/dct['Right_Cycle_Time_Mean'] * 100, 1)),
+            "Initial Double Limb Support, %": (
+                round(dct['Right_Terminal_Double_Limb_Support_Time_Mean']/dct['Left_Cycle_Time_Mean'] * 100, 1),
+                round(dct['Right_Initial_Double_Limb_Support_Time_Mean']/dct['Right_Cycle_Time_Mean'] * 100, 1),
+            ),
+        }
+        both = {
+            "Speed, m/s": round(dct['Speed'], 2),
+            "Cadence, steps/min": round((dct['Left_Steps_Per_Minute_Mean'] + dct['Right_Steps_Per_Minute_Mean'])/2, 0),
+            "Cycle Time, s": round(dct['Cycle_Time_Mean'], 2),
+            "Stride Length, cm": round(dct['Stride_Length_Mean']*100, 0),
+            "Stride Width, cm": round(dct['Stride_Width_Mean']*100, 1),
+        }
+        df_ts = pd.DataFrame(
+            {
+                "Parameters": list(both.keys()) + list(leftright.keys()),
+                "Both": list(both.values()) + [np.nan] * len(leftright),
+                "Left": [np.nan] * len(both) + [v[0] for v in leftright.values()],
+                "Right": [np.nan] * len(both) + [v[1] for v in leftright.values()],
+            }
+        )
+        return df_ts
+    
+    @timed("core.gps")
+    def gps_from_curves(self):
+        """
+        GPS and GVS like `process_map`, computed from the kinematics and
+        their norms: means over walking trials, rounded to 0.1.
+        """
+        c = Config.load()
+        gvs, gps, overall = self.kinematics.gait_profile(c.gps["params"])
+        table = np.concatenate([gps[None], gvs])  # (metric, side, trial)
+        count = (~np.isnan(table)).sum(axis=-1)
+        total = np.nansum(table, axis=-1)
+        means = np.round(np.divide(total, count, out=np.full(total.shape, np.nan), where=count > 0), 1)
+        pivoted = pd.DataFrame(
+            {"Metric": ["Gait Profile Score", *c.gps["names"]], "Left": means[:, 0], "Right": means[:, 1]}
+        )
+        pivoted.columns.name = "side"
+        valid = ~np.isnan(overall)
+        return (round(float(overall[valid].mean()), 1) if valid.any() else np.nan, pivoted)
+
+    def gps_trials(self) -> pd.DataFrame:
+        """GPS of every walking trial, columns `["Trial", "Left", "Right", "Overall"]`"""
+        c = Config.load()
+        cv = self.kinematics
+        _, gps, overall = cv.gait_profile(c.gps["params"])
+        names = next((cv.trial_names[cv[p].index][0] for p in c.gps["params"] if p in cv), [])
+        table = pd.DataFrame(
+            {
+                "Trial": list(names) + [""] * (len(overall) - len(names)),
+                "Left": np.round(gps[0], 1),
+                "Right": np.round(gps[1], 1),
+                "Overall": np.round(overall, 1),
+            }
+        )
+        return table[~np.isnan(gps).all(axis=0)].reset_index(drop=True)
+
+    def process_map(self, table):
+        row = dict(zip(table.names, table.values[0].tolist()))
+        # Define GPS summary and all GVS median variables
+        gps_cols = ['Left_GPS_mean_MEAN', 'Right_GPS_mean_MEAN']
+        gvs_cols = [col for col in row if col.endswith('_gvs_MEDIAN')]
+        # Combine and build a tidy record list
+        records = []
+        for col in gps_cols + gvs_cols:
+            if col.startswith(('Left_', 'Right_')):
+                side_label, metric = col.split('_', 1)
+            else:
+                side_label, metric = col.split(' ', 1)
+            records.append({
+                'metric': metric,
+                'side': side_label,
+                'value': row[col]
+            })
+        overall = row['Overall_GPS_mean_MEAN']
+        tidy_df = pd.DataFrame(records)
+        pivoted = tidy_df.pivot(index='metric', columns='side', values='value').reset_index()
+        # Rename metrics
+        old_to_new = {
+            'GPS_mean_MEAN': 'Gait Profile Score',
+            'Pelvic Angles_X_gvs_MEDIAN': "Pelvis Tilt",
+            'Pelvic Angles_Y_gvs_MEDIAN': "Pelvis Obl",
+            'Pelvic Angles_Z_gvs_MEDIAN': "Pelvis Rot",
+            'Hip Angles_X_gvs_MEDIAN': 'Hip Fle/Ext',
+            'Hip Angles_Y_gvs_MEDIAN': 'Hip Add/Abd',
+            'Hip Angles_Z_gvs_MEDIAN': 'Hip Rot',
+            'Knee Angles_X_gvs_MEDIAN': "Knee Fle/Ext",
+            'Ankle Angles_X_gvs_MEDIAN': 'Ankle Dor/Pla',
+            'Foot Progression_Z_gvs_MEDIAN': 'Foot Prog',
+        }
+        pivoted['metric'] = pivoted['metric'].map(old_to_new).fillna(pivoted['metric'])
+        desired_order = list(old_to_new.values())
+        pivoted = (
+            pivoted
+            .set_index('metric')      # make metrics the index…
+            .loc[desired_order]       # …and pick them in the right order
+            .reset_index()            # back to a normal column
+        )
+        pivoted.rename(columns={'metric':'Metric'}, inplace=True)
+        return (overall, pivoted)
+
+class _SharedParams(Mapping):
+    """`DataCompare.params`: domain -> shared parameter names, looked up on first access"""
+
+    def __init__(self, dc):
+        self._dc = dc
+
+    def __getitem__(self, domain):
+        if domain not in Config.domains:
+            raise KeyError(domain)
+        return self._dc.shared(domain)[0]
+
+    def __iter__(self):
+        return iter(Config.domains)
+
+    def __len__(self):
+        return len(Config.domains)
+
+
+class DataCompare:
+    """
+    Any number of measurements aligned for comparison.
+
+    Nothing is computed on construction: the parameters shared by all
+    datasets are looked up when their domain is first asked for, which
+    builds its curves only then (see `DataSet.curves`). Everything else is
+    computed on first use and kept, so one instance can be cached per
+    selection and switching between parameters is a dict lookup. For a parameter, the mean curves of all
+    datasets form one (dataset, side, sample) array; the phase stats of a
+    whole domain take one `Curves.phase_stats` call per dataset.
+
+    Parameters
+    ----------
+    datasets : list of DataSet
+        Measurements in display order; the first is the baseline of
+        `phase_deltas`.
+    labels : list of str, optional
+        Legend and table labels, the dataset titles by default.
+
+    Attributes
+    ----------
+    key : tuple
+        `DataSet.key` of every dataset and the labels, identifies the comparison.
+    params : mapping of str -> list of str
+        Domain -> names of the parameters found in all datasets, in config order.
+    """
+
+    def __init__(self, datasets: list, labels: list = None):
+        self.datasets = list(datasets)
+        self.labels = list(labels) if labels else [d.title for d in self.datasets]
+        self.key = (tuple(d.key for d in self.datasets), tuple(self.labels))
+        self.params = _SharedParams(self)
+        self._memo = {}  # (method, args) -> result
+
+    def shared(self, domain: str):
+        """
+        (names, index) of the parameters of `domain` found in all datasets:
+        names in config order and the (dataset, param) index into each
+        dataset's Curves.
+        """
+
+        def build():
+            curves = [getattr(d, domain) for d in self.datasets]
+            names = [name for name in curves[0] if all(name in cv for cv in curves[1:])]
+            index = np.array([[cv[name].index for name in names] for cv in curves], dtype=np.intp)
+            return names, index.reshape(len(curves), len(names))
+
+        return self._cached(("shared", domain), build)
+
+    def _cached(self, key, build):
+        value = self._memo.get(key)
+        if value is None:
+            value = self._memo[key] = build()
+        return value
+
+    def param(self, domain: str, name: str) -> Param:
+        """`Param` of the first dataset, for labels and axes"""
+        return getattr(self.datasets[0], domain)[name]
+
+    def means(self, domain: str, name: str) -> np.ndarray:
+        """(dataset, side, sample) mean curves of one parameter, NaN padded"""
+
+        def build():
+            names, index = self.shared(domain)
+            p = names.index(name)
+            curves = [getattr(d, domain) for d in self.datasets]
+            means = np.full((len(curves), 2, max(cv.means.shape[-1] for cv in curves)), np.nan)
+            for k, cv in enumerate(curves):
+                means[k, :, : cv.means.shape[-1]] = cv.means[index[k, p]]
+            return means
+
+        return self._cached(("means", domain, name), build)
+
+    def df_means(self, domain: str, name: str) -> pd.DataFrame:
+        """Gait cycle and the `Left Mean k`, `Right Mean k` curves of dataset k = 1..N"""
+
+        def build():
+            means = self.means(domain, name)
+            data = {"Gait cycle": np.arange(means.shape[-1])}
+            for k, (left, right) in enumerate(means, 1):
+                data[f"Left Mean {k}"] = left
+                data[f"Right Mean {k}"] = right
+            return pd.DataFrame(data)
+
+        return self._cached(("df_means", domain, name), build)
+
+    def phase_stats(self, domain: str, frames) -> np.ndarray:
+        """
+        (dataset, param, side, phase, stat) max, min and ROM of the shared
+        parameters for each (% start, % end) phase, see `Curves.phase_stats`.
+        """
+        frames = tuple(tuple(pair) for pair in frames)
+
+        def build():
+            curves = [getattr(d, domain) for d in self.datasets]
+            return np.stack([cv.phase_stats(frames)[index] for cv, index in zip(curves, self.shared(domain)[1])])
+
+        return self._cached(("phase_stats", domain, frames), build)
+
+    def phase_deltas(self, domain: str, frames) -> np.ndarray:
+        """`phase_stats` minus those of the first dataset, rounded to 0.1"""
+        stats = self.phase_stats(domain, frames)
+        return np.round(stats - stats[:1], 1)
+
+    def stats_table(self, domain: str, name: str, phases: dict) -> pd.DataFrame:
+        """
+        Stats of parameter `name` for every dataset and phase, with their
+        change from the first dataset in the `Δ ...` columns.
+        """
+        frames = list(phases.values())
+
+        def build():
+            p = self.params[domain].index(name)
+            stats = self.phase_stats(domain, frames)[:, p]  # (dataset, side, phase, stat)
+            deltas = self.phase_deltas(domain, frames)[:, p]
+            n_datasets, _, n_phases, _ = stats.shape
+            columns = [f"{side[0]} {stat}" for side in SIDES for stat in STATS]
+            table = pd.DataFrame(
+                {
+                    "Measurement": np.repeat(self.labels, n_phases),
+                    "Phase": list(phases) * n_datasets,
+                    "% Start": [start for start, _ in frames] * n_datasets,
+                    "% End": [end for _, end in frames] * n_datasets,
+                }
+            )
+            # (dataset, side, phase, stat) -> (dataset * phase, side * stat)
+            table[columns] = stats.transpose(0, 2, 1, 3).reshape(n_datasets * n_phases, -1)
+            table[[f"Δ {col}" for col in columns]] = deltas.transpose(0, 2, 1, 3).reshape(n_datasets * n_phases, -1)
+            return table
+
+        key = tuple((phase, tuple(pair)) for phase, pair in phases.items())
+        return self._cached(("stats_table", domain, name, key), build)
+
+
+class Export:
+    """
+    Collects multiple DataFrame sections and writes them
+    into a single Excel sheet, returning a bytes payload.
+    """
+    def __init__(
+        self,
+        title: str,
+        info_df: pd.DataFrame,
+        ts_df: pd.DataFrame,
+        stats_map: dict,
+        sheet_name: str
+    ):
+        self.title = title
+        self.info_df = info_df
+        self.ts_df = ts_df
+        self.stats_map = stats_map
+        self.sheet_name = sheet_name
+
+        # In-memory workbook setup
+        self.output = BytesIO()
+        self.writer = pd.ExcelWriter(self.output, engine="xlsxwriter")
+        self.workbook = self.writer.book
+        self.worksheet = self.workbook.add_worksheet(self.sheet_name)
+        self.bold = self.workbook.add_format({"bold": True})
+
+        # layout: start writing data at row 2 (title goes at row 0)
+        self.current_row = 2
+        self.worksheet.set_column(0, 0, 20)
+
+    def write_title(self):
+        self.worksheet.write_string(0, 0, self.title, self.bold)
+
+    def write_info(self):
+        self.info_df.to_excel(
+            self.writer,
+            sheet_name=self.sheet_name,
+            startrow=self.current_row,
+            index=False
+        )
+        self.current_row += self.info_df.shape[0] + 2
+
+    def write_time_spatial(self):
+        self.ts_df.to_excel(
+            self.writer,
+            sheet_name=self.sheet_name,
+            startrow=self.current_row,
+            index=False
+        )
+        self.current_row += self.ts_df.shape[0] + 2
+
+    def write_stats(self):
+        for param, block in self.stats_map.items():
+            # header
+            self.worksheet.write_string(self.current_row, 0, param, self.bold)
+            self.current_row += 1
+
+            # stats table
+            df_stats = block["df_stats"]
+            df_stats.to_excel(
+                self.writer,
+                sheet_name=self.sheet_name,
+                startrow=self.current_row,
+                index=False
+            )
+            self.current_row += df_stats.shape[0] + 2
+
+            # comments
+            self.worksheet.write_string(
+                self.current_row, 0, block.get("comments", "")
+            )
+            self.current_row += 2
+
+    def save(self) -> bytes:
+        self.writer.close()
+        return self.output.getvalue()
+
+    def export(self) -> bytes:
+        """Write everything and return raw Excel bytes in one call."""
+        self.write_title()
+        self.write_info()
+        self.write_time_spatial()
+        self.write_stats()
+        return self.save()
+
+    @classmethod
+    @timed("export.xlsx")
+    def to_bytes(
+        cls,
+        dataset: DataSet, 
+        stats_map: dict,
+        sheet_name: str = "Sheet1"
+    ) -> bytes:
+        """
+        Convenience entrypoint: do one call from Streamlit:
+           Export.to_bytes(...)
+        """
+        exporter = cls(dataset.title, dataset.info, dataset.ts, stats_map, sheet_name)
+        return exporter.export()
+
+    @staticmethod
+    def fingerprint(dataset: DataSet, stats_map: dict, sheet_name: str = "Sheet1") -> str:
+        """
+        Content hash of the report `to_bytes` would write: equal fingerprints
+        give the same workbook, so callers can keep the bytes and rebuild
+        only when a table or comment changed.
+        """
+        h = hashlib.sha256(f"{dataset.key}\0{sheet_name}".encode())
+        for param, block in stats_map.items():
+            df_stats = block["df_stats"]
+            h.update(f"\0{param}\0{block.get('comments', '')}\0{list(df_stats.columns)}".encode())
+            h.update(pd.util.hash_pandas_object(df_stats, index=False).to_numpy().tobytes())
+        return h.hexdigest()
+
+
+class StreamExport:
+    """
+    Multi-sheet workbook written row by row in xlsxwriter's constant_memory
+    mode, for reports too large to hold in RAM.
+
+    Sheets, in order: "Report" (what `Export` writes), "Stats" (every
+    parameter for every phase), then one sheet per parameter with the mean
+    and normative curves followed by the curves of every trial. Each row is
+    flushed to a temporary file as soon as the next one starts, so memory
+    stays flat however many parameters and trials there are.
+
+    Parameters
+    ----------
+    target : str or file-like
+        Path or binary buffer the finished .xlsx is written to.
+    """
+
+    def __init__(self, target):
+        self.workbook = xlsxwriter.Workbook(target, {"constant_memory": True})
+        self.bold = self.workbook.add_format({"bold": True})
+        self.sheet_names = set()
+
+    def add_sheet(self, name: str):
+        """Worksheet named after `name`, made valid and unique for Excel"""
+        name = "".join("_" if ch in "[]:*?/\\" else ch for ch in name)[:31]
+        base, n = name, 1
+        while name.lower() in self.sheet_names:
+            n += 1
+            name = f"{base[: 31 - len(str(n)) - 1]} {n}"
+        self.sheet_names.add(name.lower())
+        return self.workbook.add_worksheet(name)
+
+    @staticmethod
+    def write_cell(ws, row: int, col: int, value, fmt=None):
+        if value is None or isinstance(value, float) and np.isnan(value):
+            return  # empty cell
+        if isinstance(value, (int, float, np.integer, np.floating)) and not isinstance(value, bool):
+            ws.write_number(row, col, value, fmt)
+        else:
+            ws.write_string(row, col, str(value), fmt)
+
+    def write_table(self, ws, row: int, df: pd.DataFrame) -> int:
+        """Write `df` with a bold header from `row` on, return the next free row"""
+        for col, name in enumerate(df.columns):
+            ws.write_string(row, col, str(name), self.bold)
+        for values in df.itertuples(index=False):
+            row += 1
+            for col, value in enumerate(values):
+                self.write_cell(ws, row, col, value)
+        return row + 1
+
+    def write_report(self, dataset: DataSet, stats_map: dict):
+        """The single-sheet report of `Export`"""
+        ws = self.add_sheet("Report")
+        ws.set_column(0, 0, 20)
+        ws.write_string(0, 0, dataset.title, self.bold)
+        row = self.write_table(ws, 2, dataset.info) + 1
+        row = self.write_table(ws, row, dataset.ts) + 1
+        for param, block in stats_map.items():
+            ws.write_string(row, 0, param, self.bold)
+            row = self.write_table(ws, row + 1, block["df_stats"]) + 1
+            ws.write_string(row, 0, block.get("comments", ""))
+            row += 2
+
+    def write_stats(self, dataset: DataSet, phases: dict):
+        """Long table of the stats of every parameter for every phase"""
+        ws = self.add_sheet("Stats")
+        ws.set_column(0, 1, 20)
+        header = ["Domain", "Parameter", "Phase", "% Start", "% End", *STAT_COLUMNS]
+        for col, name in enumerate(header):
+            ws.write_string(0, col, name, self.bold)
+        row = 0
+        for domain in Config.domains:
+            for param, dfs in getattr(dataset, domain).items():
+                for phase, frames, values in zip(phases, phases.values(), dfs.stats_values(list(phases.values()))):
+                    row += 1
+                    for col, value in enumerate([domain, param, phase, *frames, *values.tolist()]):
+                        self.write_cell(ws, row, col, value)
+
+    def write_curves(self, dataset: DataSet, trials: bool = True):
+        """One sheet per parameter: gait cycle, means, norm and (optionally) every trial"""
+        for domain in Config.domains:
+            cv = getattr(dataset, domain)
+            for param, dfs in cv.items():
+                i = dfs.index
+                columns = [("Gait cycle", cv.cycle), ("Left Mean", cv.means[i, 0]), ("Right Mean", cv.means[i, 1])]
+                if cv.has_norm[i]:
+                    columns += [("Norm Mean", cv.norms[i, 0]), ("Norm SD", cv.norms[i, 1])]
+                if trials:
+                    for side, names in enumerate(cv.trial_names[i]):
+                        columns += [(f"{SIDES[side]} {name}", cv.trials[i, side, t]) for t, name in enumerate(names)]
+                ws = self.add_sheet(param)
+                for col, (name, _) in enumerate(columns):
+                    ws.write_string(0, col, name, self.bold)
+                block = np.column_stack([values for _, values in columns]).tolist()
+                for row, values in enumerate(block, 1):
+                    for col, value in enumerate(values):
+                        if value == value:  # skip NaN
+                            ws.write_number(row, col, value)
+
+    def close(self):
+        self.workbook.close()
+
+    @classmethod
+    @timed("export.stream")
+    def write(
+        cls,
+        target,
+        dataset: DataSet,
+        stats_map: dict,
+        phases: dict = None,
+        trials: bool = True,
+    ):
+        """
+        Write the full workbook of `dataset` to `target` in one call;
+        `phases` defaults to the config phases.
+        """
+        exporter = cls(target)
+        try:
+            exporter.write_report(dataset, stats_map)
+            exporter.write_stats(dataset, phases or Config.load().phases)
+            exporter.write_curves(dataset, trials)
+        finally:
+            exporter.close()
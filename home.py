@@ -1,10 +1,22 @@
 import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 import pandas as pd
+import atexit
+import shutil
+import tempfile
+import time
 import zipfile
-import importlib
-import classes
-importlib.reload(classes)  # reload config
-from classes import DataSet, Plot, PlotLayout, Export, DataCompare, PlotCompare
+from contextlib import contextmanager
+from core import Config, DataSet, Export, DataCompare
+from classes import Plot, PlotLayout, PlotCompare
+from cache import LRUCache, ParseCache
+from instrument import Collector, span, to_json, to_openmetrics
+from instrument import current as current_collector  # `current` is the page below
+from ingest import LazyArchive
+import cohort
+from memory import MB, MemoryLedger, Spilled, nbytes, trim_plot_state
+from store import MeasurementStore
+from similarity import CurveIndex
 
 NUM_WORDS = {
     1: "one",
@@ -42,6 +54,225 @@ def home():
     st.write("⏱ For the moment, the comparison page functionality is limited")
     st.write("Write your reactions to ilya112358@gmail.com or visit GitHub repo https://github.com/ilya112358/gar")
     st.write("*(version 2025.10)*")
+    loaded = [m["dataset"] for m in st.session_state.get("pages", []) if m["dataset"] in st.session_state]
+    if loaded:
+        st.header("Cohort export", divider=True)
+        st.write(f"Temporal and spatial parameters, GPS and mean curves of the {len(loaded)} loaded measurements as long-format Parquet tables with an Excel summary")
+        cohort_download(loaded)
+
+def cohort_download(dataset_keys: list):
+    """Zipped cohort dataset of the loaded measurements, built on request and kept until the set changes"""
+    keys = [st.session_state[k].key for k in dataset_keys]  # also of spilled ones, see get_loaded
+    if st.session_state.get("cohort_export", (None,))[0] != keys:
+        if not st.button("Prepare cohort.zip"):
+            return
+        st.session_state["cohort_export"] = (keys, cohort.to_zip(get_loaded(k) for k in dataset_keys))
+    st.download_button(
+        label="Download cohort.zip",
+        data=st.session_state["cohort_export"][1],
+        file_name="cohort.zip",
+        mime="application/zip"
+    )
+
+@st.cache_resource
+def get_parse_cache() -> ParseCache:
+    """One cache of processed measurements for all sessions"""
+    c = Config.load()
+    return ParseCache(c.cache["max_entries"], c.cache["disk_dir"] or None, c.cache["disk_mb"])
+
+@st.cache_resource
+def compare_cache() -> LRUCache:
+    """DataCompare instances shared by all sessions, keyed by `DataCompare.key`"""
+    return LRUCache(Config.load().cache["compare_entries"])
+
+def get_comparison(datasets: list, labels: list) -> DataCompare:
+    """The cached comparison of `datasets`, built on the first request"""
+    key = (tuple(d.key for d in datasets), tuple(labels))
+    cache = compare_cache()
+    dc = cache.get(key)
+    if dc is None:
+        dc = DataCompare(datasets, labels)
+        cache.put(key, dc)
+    # the cached comparison keeps its datasets alive, stored ones included: account them to this session
+    ledger = get_ledger()
+    session = session_id()
+    for name in ledger.entries(session):
+        if name.startswith("compare."):
+            ledger.forget(session, name)
+    for d in datasets:
+        ledger.update(session, f"compare.{d.key}", nbytes(d), shared=d.key)
+    ledger.update(session, "compare", nbytes(dc, skip=datasets))
+    return dc
+
+@st.cache_resource
+def get_store():
+    """The persistent measurement store, None if `store.dir` is not configured"""
+    c = Config.load()
+    return MeasurementStore(c.store["dir"]) if c.store["dir"] else None
+
+@st.cache_resource
+def stored_cache() -> LRUCache:
+    """Measurements read back from the store, shared by all sessions"""
+    return LRUCache(Config.load().cache["max_entries"])
+
+def get_stored(key: str) -> DataSet:
+    """The measurement stored under `key`, read from disk only until it is cached"""
+    store = get_store()
+    cache_key = (key, store.config_of(key))  # a new entry after a config edit is read again
+    cache = stored_cache()
+    d = cache.get(cache_key)
+    if d is None:
+        d = store.get(key)
+        cache.put(cache_key, d)
+    return d
+
+@st.cache_resource
+def get_similarity_index():
+    """The index of kinematics curves, None if `similarity.dir` is not configured"""
+    c = Config.load()
+    return CurveIndex(c.similarity["dir"]) if c.similarity["dir"] else None
+
+@st.cache_resource
+def get_ledger() -> MemoryLedger:
+    """Memory accounts of all sessions"""
+    return MemoryLedger()
+
+@st.cache_resource
+def get_spill_store() -> MeasurementStore:
+    """Where idle measurements are saved: `memory.spill_dir`, else the store, else a temp dir of this server"""
+    c = Config.load()
+    if c.memory["spill_dir"]:
+        return MeasurementStore(c.memory["spill_dir"])
+    store = get_store()
+    if store is not None:
+        return store
+    spill_dir = tempfile.mkdtemp(prefix="gar-spill-")  # not shared with other server instances
+    atexit.register(shutil.rmtree, spill_dir, ignore_errors=True)
+    return MeasurementStore(spill_dir)
+
+def session_id() -> str:
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else "local"
+
+def get_loaded(dataset_key: str) -> DataSet:
+    """
+    The DataSet loaded into `dataset_key` ("d1"), read back from disk if it
+    was spilled. If the spilled copy is gone, e.g. removed by a temp dir
+    cleaner, the measurement is unloaded and the run stops with a warning.
+    """
+    d = st.session_state[dataset_key]
+    if isinstance(d, Spilled):
+        with span("memory.load_spilled"):
+            try:
+                d = get_parse_cache().get(d.key) or get_spill_store().get(d.archive)
+            except KeyError:
+                del st.session_state[dataset_key]
+                get_ledger().forget(session_id(), dataset_key)
+                st.warning(f"{d.title} was unloaded to save memory and its saved copy is gone, please upload it again.")
+                st.stop()
+        st.session_state[dataset_key] = d
+        get_ledger().update(session_id(), dataset_key, nbytes(d), shared=d.key)
+    else:
+        get_ledger().touch(session_id(), dataset_key)
+    return d
+
+def enforce_memory_budget(since: float):
+    """
+    Account the measurements and plot state of this session, trim plot
+    state and spill measurements not used since `since` (the start of the
+    rerun), least recently used first, while over a `[memory]` budget.
+    """
+    c = Config.load()
+    ledger = get_ledger()
+    session = session_id()
+    ledger.expire()
+    plot_configs = st.session_state.get("plot_configs", {})
+    for plot_state in plot_configs.values():
+        trim_plot_state(plot_state, c.memory["plot_state_entries"])
+    ledger.update(session, "plot_configs", nbytes(plot_configs))
+    entries = ledger.entries(session)
+    for m in st.session_state.get("pages", []):
+        d = st.session_state.get(m["dataset"])
+        if isinstance(d, DataSet) and entries.get(m["dataset"], (0, 0, None))[2] != d.key:
+            ledger.update(session, m["dataset"], nbytes(d), shared=d.key)  # loaded in this rerun
+
+    session_budget = c.memory["session_mb"] * MB or float("inf")
+    total_budget = c.memory["total_mb"] * MB or float("inf")
+    idle = sorted(
+        (last, name)
+        for name, (_, last, key) in ledger.entries(session).items()
+        if key is not None and last < since and isinstance(st.session_state.get(name), DataSet)
+    )
+    for _, name in idle:
+        if ledger.session_bytes(session) <= session_budget and ledger.total_bytes() <= total_budget:
+            break
+        d = st.session_state[name]
+        get_spill_store().put(d)  # no-op if stored with this config already
+        st.session_state[name] = Spilled(d.key, d.archive, d.title)
+        ledger.forget(session, name)
+        ledger.forget(session, f"compare.{d.key}")  # its comparisons are dropped below unless others hold it
+        if not ledger.holders(d.key):  # no session holds it, free the shared copies too
+            get_parse_cache().discard(d.key)
+            comparisons = compare_cache()
+            for key in comparisons.keys():
+                if d.key in key[0]:
+                    comparisons.discard(key)
+
+def load_dataset(source) -> DataSet:
+    """Build a DataSet from an uploaded file or an example path, reusing an identical earlier upload"""
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            data = f.read()
+    else:
+        data = source.getvalue()
+    c = Config.load()
+
+    store = get_store()
+
+    def build(data, key):
+        archive = ParseCache.digest(data)  # the same whatever the config
+        if store is not None and store.config_of(archive) == c.digest.hex():
+            return store.get(archive)  # processed in an earlier server run
+        d = DataSet(LazyArchive(data, c.required_files(), {c.info["file"]}), key, archive)  # curves built when first shown
+        st.session_state.setdefault("unsaved", []).append(d)  # see save_loaded
+        return d
+
+    with span("load.dataset"):
+        return get_parse_cache().get_or_build(data, build, salt=c.digest)
+
+def save_loaded():
+    """
+    Write the measurements built in this session to the store and the
+    similarity index. Called once the page is shown, as saving reads the
+    curves of both domains, which `load_dataset` leaves for the page to build.
+    """
+    unsaved = st.session_state.pop("unsaved", [])
+    store = get_store()
+    index = get_similarity_index()
+    for d in unsaved:
+        if store is not None:
+            store.put(d)
+        if index is not None:
+            index.add(d)
+
+def open_stored(dataset_key: str):
+    """Pick a measurement saved in the store by subject and load it into `dataset_key`"""
+    store = get_store()
+    subjects = store.subjects() if store is not None else []
+    if not subjects:
+        return
+    with st.expander("Or open a stored measurement"):
+        subject = st.selectbox("Subject", subjects, key="stored_subject")
+        rows = {row["key"]: row for row in store.find(subject=subject)}
+        key = st.selectbox(
+            "Measurement",
+            list(rows),
+            format_func=lambda key: f"{rows[key]['date']}, {rows[key]['condition']}, {rows[key]['subsession']}",
+            key="stored_measurement",
+        )
+        if st.button("Open"):
+            st.session_state[dataset_key] = get_stored(key)
+            st.rerun()
 
 def measurement(m):
     st.header(m["title"])
@@ -58,33 +289,28 @@ def measurement(m):
                 if st.button("Or use example data"):
                     uploaded_file = m["archive"]
         if uploaded_file is not None:
-            with zipfile.ZipFile(uploaded_file) as zf:
-                # all file paths (skip folders)
-                all_members = [m for m in zf.namelist() if not m.endswith('/')]
-                # if there's an Export/ folder, use only its contents
-                if any(m.startswith('Export/') for m in all_members):
-                    members = [m for m in all_members if m.startswith('Export/')]
-                else:
-                    members = all_members
-                # read each TSV into a DataFrame, keyed by its filename
-                data_dict = {
-                    path.rsplit('/', 1)[-1]: pd.read_csv(zf.open(path), sep='\t')
-                    for path in members
-                }
-                st.session_state[m["dataset"]] = DataSet(data_dict)
-                st.rerun()
+            try:
+                st.session_state[m["dataset"]] = load_dataset(uploaded_file)
+            except (FileNotFoundError, zipfile.BadZipFile) as e:
+                st.error(e)
+                st.stop()
+            st.rerun()
+        open_stored(m["dataset"])
         st.subheader("Load Measurement")
         st.write("Please upload a zip file with measurement data or use example data ☝")
     else:
-        st.title(st.session_state[m["dataset"]].title)
+        d = get_loaded(m["dataset"])
+        st.title(d.title)
         st.header("Subject", divider=True)
-        st.dataframe(st.session_state[m["dataset"]].info, hide_index=True)
+        st.dataframe(d.info, hide_index=True)
         st.header("Temporal and Spatial", divider=True)
-        # st.dataframe(st.session_state[m["dataset"]].ts.fillna(''), hide_index=True)  # removing None (np.nan) leads to a warning due to mixed types
-        st.dataframe(st.session_state[m["dataset"]].ts, hide_index=True)
+        # st.dataframe(d.ts.fillna(''), hide_index=True)  # removing None (np.nan) leads to a warning due to mixed types
+        st.dataframe(d.ts, hide_index=True)
         st.header("Gait Profile Score", divider=True)
-        st.subheader(f"Overall GPS: {st.session_state[m["dataset"]].gps[0]}")
-        st.dataframe(st.session_state[m["dataset"]].gps[1], hide_index=True)
+        st.subheader(f"Overall GPS: {d.gps[0]}")
+        st.dataframe(d.gps[1], hide_index=True)
+        if st.toggle("GPS of every trial", key=f"{m['dataset']}_gps_trials"):  # builds the kinematics
+            st.dataframe(d.gps_trials(), hide_index=True)
         category = st.selectbox(
             "You can choose the category of biomechanical parameters to plot", 
             ("Kinematics", "Kinetics", "EMG"),
@@ -93,69 +319,63 @@ def measurement(m):
         if category == "Kinematics":
             st.header(category, divider=True)
             st.subheader("Summary Grid")
-            PlotLayout(st.session_state[m["dataset"]])
+            PlotLayout(d)
             st.write(m["link_top"])
 
             @st.fragment
             def individual_plot():
-                st.subheader("Interactive Plots")
-                Plot(m["dataset"])  # "d1"
-                st.write(m["link_top"])
-
-                def get_export_data(dataset_key):
-                    """Aggregate export data from all plot states for a dataset"""
-                    plot_config_key = f"{dataset_key}_Plot"
-                    
-                    if plot_config_key in st.session_state.get("plot_configs", {}):
-                        plot_state = st.session_state["plot_configs"][plot_config_key]
-                        return plot_state.get("add_to_rep", {})
-                    return {}
-
-                report_bytes = Export.to_bytes(
-                    dataset=st.session_state[m["dataset"]],
-                    stats_map=get_export_data(m["dataset"])
-                )                
-                st.download_button(
-                    label="Download report.xlsx",
-                    data=report_bytes,
-                    file_name="report.xlsx",
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                )
+                with diagnostics_scope("fragment.kinematics"):
+                    st.subheader("Interactive Plots")
+                    Plot(m["dataset"])  # "d1"
+                    st.write(m["link_top"])
+
+                    report_download(m["dataset"], "kinematics")
 
             individual_plot()
         elif category == "Kinetics":
             st.header(category, divider=True)
             st.subheader("Summary Grid")
-            PlotLayout(st.session_state[m["dataset"]], "kinetics")
+            PlotLayout(d, "kinetics")
             st.write(m["link_top"])
 
             @st.fragment
             def individual_plot_kinetics():
-                st.subheader("Interactive Plots")
-                Plot(m["dataset"], domain="kinetics")
-                st.write(m["link_top"])
-
-                def get_export_data(dataset_key, domain):
-                    key = f"{dataset_key}_{domain}_Plot"
-                    if key in st.session_state.get("plot_configs", {}):
-                        return st.session_state["plot_configs"][key].get("add_to_rep", {})
-                    return {}
-
-                report_bytes = Export.to_bytes(
-                    dataset=st.session_state[m["dataset"]],
-                    stats_map=get_export_data(m["dataset"], "kinetics")
-                )
-                st.download_button(
-                    label="Download report.xlsx",
-                    data=report_bytes,
-                    file_name="report.xlsx",
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                )
+                with diagnostics_scope("fragment.kinetics"):
+                    st.subheader("Interactive Plots")
+                    Plot(m["dataset"], domain="kinetics")
+                    st.write(m["link_top"])
+
+                    report_download(m["dataset"], "kinetics")
 
             individual_plot_kinetics()
         else:
             st.subheader("🚧👷‍♂️ Under construction!")
 
+def report_download(dataset_key: str, domain: str):
+    """
+    Excel report of the parameters ticked for the report in `domain`.
+
+    The workbook is only built when the user asks for it and is kept in the
+    session with the fingerprint of its contents; until a stats table or
+    comment changes, reruns offer the stored bytes.
+    """
+    d = get_loaded(dataset_key)
+    plot_state = st.session_state.get("plot_configs", {}).get(f"{dataset_key}_{domain}_Plot", {})
+    stats_map = plot_state.get("add_to_rep", {})
+    fingerprint = Export.fingerprint(d, stats_map)
+    reports = st.session_state.setdefault("reports", {})  # "d1_kinematics" -> (fingerprint, bytes)
+    report_key = f"{dataset_key}_{domain}"
+    if reports.get(report_key, (None,))[0] != fingerprint:
+        if not st.button("Prepare report.xlsx", key=f"{report_key}_prepare_report"):
+            return
+        reports[report_key] = (fingerprint, Export.to_bytes(dataset=d, stats_map=stats_map))
+    st.download_button(
+        label="Download report.xlsx",
+        data=reports[report_key][1],
+        file_name="report.xlsx",
+        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    )
+
 def make_measurement_metadata(num: int) -> dict:
     word = NUM_WORDS[num]          # lowercase version
     word_cap = word.title()        # capitalized for title
@@ -176,42 +396,134 @@ def make_measurement_page(m: dict):
 
 def comparison():
     st.title("Comparison")
-    st.markdown("Pick any **two** loaded measurements to compare.")
+    st.markdown("Pick two or more loaded or stored measurements to compare, e.g. pre/post or several visits.")
 
-    # Build a dict: {title: dataset_key} for loaded measurements
+    # Build a dict: {title: callable returning the DataSet} for loaded and stored measurements
     loaded = {
-        m["title"]: m["dataset"]
+        m["title"]: (lambda key=m["dataset"]: get_loaded(key))
         for m in st.session_state.get("pages", [])
         if m["dataset"] in st.session_state
     }
+    store = get_store()
+    if store is not None:
+        for row in store.find():
+            label = f"{row['title']}, {row['subsession']} (stored {row['key'][:8]})"  # the key tells same titles apart
+            loaded[label] = lambda key=row["key"]: get_stored(key)
     if len(loaded) < 2:
         st.error("Please load at least two measurements first!", icon="🚨")
         st.stop()
     chosen_titles = st.multiselect(
-        "Choose two measurements",
+        "Choose measurements",
         options=list(loaded.keys()),
         default=list(loaded.keys())[:2],
-        max_selections=2
     )
-    if len(chosen_titles) != 2:
-        st.info("Select exactly two measurements to proceed.")
+    if len(chosen_titles) < 2:
+        st.info("Select at least two measurements to proceed.")
+        st.stop()
+    datasets = [loaded[title]() for title in chosen_titles]
+
+    info = pd.concat([d.info.set_index("Metadata")["Value"] for d in datasets], axis=1)
+    info.columns = [f"{k}. {title}" for k, title in enumerate(chosen_titles, 1)]
+    st.dataframe(info)
+
+    st.markdown("You can only compare parameters present in **all** chosen measurements.")
+    dc = get_comparison(datasets, [f"{k}. {d.title}" for k, d in enumerate(datasets, 1)])
+    domain = st.radio("Category", ("Kinematics", "Kinetics"), horizontal=True).lower()
+    if not dc.params[domain]:
+        st.info(f"No {domain} parameter is present in all chosen measurements.")
+        st.stop()
+    param = st.selectbox("Select parameter", dc.params[domain])
+    PlotCompare(dc, domain, param)
+
+def similar():
+    st.title("Similar Patients")
+    st.markdown("Find the sessions in the library whose kinematics look most like a loaded measurement.")
+    index = get_similarity_index()
+    if index is None:
+        st.info("Set `dir` in the `[similarity]` section of config.toml to build a library of gait curves.")
         st.stop()
-    key_a, key_b = loaded[chosen_titles[0]], loaded[chosen_titles[1]]
-    ds_a, ds_b = st.session_state[key_a], st.session_state[key_b]
-
-    col1, col2 = st.columns(2)
-    with col1:
-        st.markdown(f"### {chosen_titles[0]}")
-        st.dataframe(ds_a.info, hide_index=True)
-    with col2:
-        st.markdown(f"### {chosen_titles[1]}")
-        st.dataframe(ds_b.info, hide_index=True)
-
-    st.markdown("You can only compare parameters present in **both** measurements.")
-    st.markdown("Graphs are **solid** for the first measurement and **dashed** for the second.")
-    dc = DataCompare(ds_a, ds_b)
-    param = st.selectbox("Select parameter", list(dc.data2plot.keys()))
-    PlotCompare(dc, param)
+    loaded = {
+        m["title"]: m["dataset"]
+        for m in st.session_state.get("pages", [])
+        if m["dataset"] in st.session_state
+    }
+    if not loaded:
+        st.error("Please load a measurement first!", icon="🚨")
+        st.stop()
+    title = st.selectbox("Measurement", list(loaded.keys()))
+    k = st.slider("Number of matches", 1, 20, 5)
+    d = get_loaded(loaded[title])
+    matches = index.query(d, k)
+    st.markdown(f"{len(matches)} closest of {len(index)} indexed sessions, by RMS difference of all kinematics curves from this one (degrees)")
+    table = pd.DataFrame([{**row, "RMS difference": round(dist, 2)} for row, dist in matches])
+    st.dataframe(table.drop(columns="key", errors="ignore"), hide_index=True)
+
+    store = get_store()
+    stored = [row for row, _ in matches if store is not None and row["key"] in store][:4]
+    if stored:
+        st.header("Compare with the closest stored sessions", divider=True)
+        datasets = [d] + [get_stored(row["key"]) for row in stored]
+        dc = get_comparison(datasets, [f"{k}. {x.title}" for k, x in enumerate(datasets, 1)])
+        if not dc.params["kinematics"]:
+            st.info("No kinematics parameter is present in this and the stored sessions.")
+            st.stop()
+        param = st.selectbox("Select parameter", dc.params["kinematics"])
+        PlotCompare(dc, "kinematics", param)
+
+@contextmanager
+def diagnostics_scope(name: str):
+    """
+    Record the spans of the block under `name` into a collector of its own
+    and add them to the session's, also when the block stops or reruns
+    early. Yields the collector, None with diagnostics off. Inside an active
+    collector (a fragment during a full rerun) the block is a span of it.
+    """
+    if not Config.load().diagnostics["enabled"]:
+        yield None
+        return
+    outer = current_collector()
+    if outer is not None:
+        with span(name):
+            yield outer
+        return
+    collector = Collector()
+    try:
+        with collector.active(), span(name):
+            yield collector
+    finally:
+        st.session_state.setdefault("diagnostics", Collector()).merge(collector)
+
+def diagnostics(rerun: Collector):
+    """Sidebar panel with the spans of this rerun and of the whole session"""
+    scopes = {"rerun": rerun, "session": st.session_state["diagnostics"]}
+    ledger = get_ledger()
+    with st.sidebar.expander("Diagnostics"):
+        st.caption(
+            f"Memory: {ledger.session_bytes(session_id()) / MB:.1f} MB in this session, "
+            f"{ledger.total_bytes() / MB:.1f} MB in {len(ledger.rows())} sessions"
+        )
+        for scope, collector in scopes.items():
+            st.caption(f"This {scope}")
+            rows = collector.rows()
+            if rows:
+                st.dataframe(
+                    pd.DataFrame(rows).set_index("span"),
+                    column_config={
+                        "total_s": st.column_config.NumberColumn("total, s", format="%.3f"),
+                        "mean_s": st.column_config.NumberColumn("mean, s", format="%.3f"),
+                        "max_s": st.column_config.NumberColumn("max, s", format="%.3f"),
+                        "rss_mb": st.column_config.NumberColumn("RSS +MB", format="%.1f"),
+                    },
+                )
+        st.download_button("Download JSON", to_json(scopes), file_name="diagnostics.json", mime="application/json")
+        st.download_button(
+            "Download OpenMetrics",
+            to_openmetrics(scopes),
+            file_name="diagnostics.txt",
+            mime="application/openmetrics-text",
+        )
+        if st.button("Reset session"):
+            st.session_state["diagnostics"] = Collector()
 
 # Initialization
 st.set_page_config(
@@ -230,5 +542,13 @@ if st.sidebar.button("Add Measurement"):    # TODO gray-out when limit reached
 for idx, m in enumerate(st.session_state.pages):
     pages.append(st.Page(make_measurement_page(m), title=m["title"], icon=":material/analytics:", url_path=m["url_path"]))
 pages.append(st.Page(comparison, title="Compare", icon=":material/balance:"))
+pages.append(st.Page(similar, title="Similar", icon=":material/search:"))
 current = st.navigation(pages)
-current.run()
+since = time.monotonic()
+with diagnostics_scope(f"page.{current.title}") as rerun:  # fragment reruns skip this, see the fragments
+    current.run()
+if rerun is not None:
+    diagnostics(rerun)
+with diagnostics_scope("save.loaded"):
+    save_loaded()
+enforce_memory_budget(since)
@@ -0,0 +1,200 @@
+import threading
+import zipfile
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO, StringIO
+
+import numpy as np
+import pandas as pd
+
+from instrument import propagate, span
+
+HEADER_ROWS = 5  # trial names, signal names, type, folder, ITEM/component
+
+
+class V3DTable:
+    """
+    One Visual3D text export: five header rows above a tabular body.
+
+    The first column holds row labels (empty in the header, `ITEM` in the
+    fifth row, sample numbers in the body); it is kept apart from the data
+    columns, so every list and the body below have one entry per column.
+
+    Attributes
+    ----------
+    columns : list of str
+        First header row, e.g. trial file names (`"Gait FB - IOR 1.c3d"`).
+    names : list of str
+        Second header row, signal or metric names (`"Left Ankle Angles"`).
+    types : list of str
+        Third header row (`"LINK_MODEL_BASED"`, `"TEXT_DATA"`, ...).
+    folders : list of str
+        Fourth header row (`"ORIGINAL"`, `"META"`, ...).
+    components : list of str
+        The `ITEM` row (`"X"`, `"Y"`, `"Z"` or `"0"`).
+    frames : numpy.ndarray
+        Body row labels, sample numbers 1..N for curves.
+    values : numpy.ndarray or None
+        float64 body of shape (rows, columns); `None` for text exports.
+    text : list of list of str or None
+        Body as strings for text exports such as Info.txt, else `None`.
+    """
+
+    __slots__ = ("columns", "names", "types", "folders", "components", "frames", "values", "text")
+
+    def __init__(self, header, frames, values=None, text=None):
+        self.columns, self.names, self.types, self.folders, self.components = header
+        self.frames = frames
+        self.values = values
+        self.text = text
+
+
+def read_v3d(raw: bytes, numeric: bool = True) -> V3DTable:
+    """
+    Parse a Visual3D export straight into a `V3DTable`.
+
+    Numeric bodies go through NumPy's C reader into one float64 block;
+    only if that fails (empty or non-numeric cells) pandas is used and bad
+    cells become NaN.
+    """
+    lines = raw.decode("utf-8", errors="replace").splitlines()
+    header = [line.split("\t")[1:] for line in lines[:HEADER_ROWS]]
+    header += [[] for _ in range(HEADER_ROWS - len(header))]
+    body = lines[HEADER_ROWS:]
+    if not numeric:
+        rows = [line.split("\t") for line in body if line]
+        frames = np.array([r[0] for r in rows], dtype=object)
+        return V3DTable(header, frames, text=[r[1:] for r in rows])
+    ncols = len(header[0]) + 1
+    try:
+        block = np.loadtxt(body, delimiter="\t", dtype=np.float64, ndmin=2)
+        if block.shape[1] != ncols:
+            raise ValueError("body and header widths differ")
+    except ValueError:
+        with span("ingest.read_csv"):
+            block = (
+                pd.read_csv(StringIO("\n".join(body)), sep="\t", header=None, names=range(ncols))
+                .apply(pd.to_numeric, errors="coerce")
+                .to_numpy(dtype=np.float64)
+            )
+    return V3DTable(header, block[:, 0], values=block[:, 1:])
+
+
+def select_members(names: list, wanted: set = None) -> dict:
+    """
+    Pick the archive members to read.
+
+    Folders are skipped and, if the archive has an `Export/` folder, only
+    its contents are used. With `wanted` given, files whose base name is not
+    in it are skipped as well.
+
+    Returns
+    -------
+    dict of str -> str
+        Base file name -> path inside the archive.
+    """
+    # all file paths (skip folders)
+    all_members = [m for m in names if not m.endswith("/")]
+    # if there's an Export/ folder, use only its contents
+    if any(m.startswith("Export/") for m in all_members):
+        all_members = [m for m in all_members if m.startswith("Export/")]
+    members = {path.rsplit("/", 1)[-1]: path for path in all_members}
+    if wanted is not None:
+        members = {name: path for name, path in members.items() if name in wanted}
+    return members
+
+
+class LazyArchive(Mapping):
+    """
+    The files of a zipped export as `V3DTable`s, each read on first access.
+
+    Lookups and `in` tests of names need no parsing; `prefetch` reads
+    several members in a thread pool ahead of use. Parsed tables are kept,
+    and pickling keeps only the archive bytes.
+
+    Parameters are those of `read_archive`.
+    """
+
+    def __init__(self, data: bytes, wanted: set = None, text_files: set = ()):
+        self.data = data
+        self.wanted = wanted
+        self.text_files = text_files
+        self._zip = zipfile.ZipFile(BytesIO(data))
+        self.members = select_members(self._zip.namelist(), wanted)
+        self._tables = {}
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        return {"data": self.data, "wanted": self.wanted, "text_files": self.text_files}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def __getitem__(self, name):
+        table = self._tables.get(name)
+        if table is None:
+            path = self.members[name]  # KeyError for files not in the archive
+            # ZipFile guards the shared file handle with a lock, so members can
+            # be read concurrently; decompression happens in each caller.
+            with span("ingest.unzip"):
+                raw = self._zip.read(path)
+            with span("ingest.parse"):
+                table = read_v3d(raw, numeric=name not in self.text_files)
+            with self._lock:
+                table = self._tables.setdefault(name, table)
+        return table
+
+    def __iter__(self):
+        return iter(self.members)
+
+    def __len__(self):
+        return len(self.members)
+
+    def __contains__(self, name):
+        return name in self.members
+
+    def release(self, names):
+        """Forget the parsed tables of `names`, e.g. once they are copied into arrays"""
+        with self._lock:
+            for name in names:
+                self._tables.pop(name, None)
+
+    def prefetch(self, names=None, max_workers: int = None):
+        """Read `names` (all members by default) in a thread pool; zlib releases the GIL while inflating"""
+        names = [name for name in (self.members if names is None else names) if name in self.members]
+        names = [name for name in names if name not in self._tables]
+        if len(names) > 1:
+            with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                list(pool.map(propagate(self.__getitem__), names))
+        elif names:
+            self[names[0]]
+
+
+def read_archive(data: bytes, wanted: set = None, text_files: set = (), max_workers: int = None) -> dict:
+    """
+    Read the files of a zipped export into `V3DTable`s.
+
+    Members are decompressed and parsed in a thread pool; zlib releases the
+    GIL while inflating. See `LazyArchive` to read them on demand instead.
+
+    Parameters
+    ----------
+    data : bytes
+        Content of the zip archive.
+    wanted : set of str, optional
+        Base file names to read (see `Config.required_files`); all files
+        are read if omitted.
+    text_files : set of str
+        Base file names whose body is text rather than numbers (Info.txt).
+    max_workers : int, optional
+        Size of the thread pool, `None` for the executor default.
+
+    Returns
+    -------
+    dict of str -> V3DTable
+        Parsed tables keyed by base file name.
+    """
+    with span("ingest.read_archive"):
+        archive = LazyArchive(data, wanted, text_files)
+        archive.prefetch(max_workers=max_workers)
+        return dict(archive)
@@ -0,0 +1,191 @@
+"""
+Timing and memory spans around the hot paths.
+
+    with span("ingest.unzip"):
+        raw = zf.read(name)
+
+    @timed("core.DataSet")
+    def __init__(self, d, key=None): ...
+
+Spans are only recorded while a `Collector` is active in the current thread:
+
+    rerun = Collector()
+    with rerun.active():
+        page.run()
+    session.merge(rerun)
+
+Without one, `span` returns a shared no-op context and `timed` calls the
+function directly, so instrumented code costs a thread-local lookup.
+Work handed to a thread pool is recorded into the caller's collector when
+the function is wrapped with `propagate`.
+
+Every span name keeps a count, the total and maximum wall time and the
+growth of the process resident set size. RSS is process-wide, so with
+several sessions busy at once it is only indicative. Collections export to
+JSON (`to_json`) and OpenMetrics text (`to_openmetrics`).
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+
+
+class _Local(threading.local):
+    collector = None  # class default: a missing attribute would cost an exception per lookup
+
+
+_local = _Local()
+_NOOP = nullcontext()
+_PAGE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def rss_bytes() -> int:
+    """Current resident set size; 0 where /proc is not available"""
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * _PAGE
+    except OSError:
+        return 0
+
+
+class Collector:
+    """
+    Aggregated spans: name -> [count, total seconds, max seconds, RSS growth bytes].
+
+    Safe to record into from several threads.
+    """
+
+    def __init__(self):
+        self.spans = {}
+        self._lock = threading.Lock()
+
+    def record(self, name: str, seconds: float, rss: int = 0):
+        with self._lock:
+            entry = self.spans.get(name)
+            if entry is None:
+                self.spans[name] = [1, seconds, seconds, rss]
+            else:
+                entry[0] += 1
+                entry[1] += seconds
+                entry[2] = max(entry[2], seconds)
+                entry[3] += rss
+
+    def merge(self, other: "Collector"):
+        with self._lock:
+            for name, (count, total, peak, rss) in other.spans.items():
+                entry = self.spans.setdefault(name, [0, 0.0, 0.0, 0])
+                entry[0] += count
+                entry[1] += total
+                entry[2] = max(entry[2], peak)
+                entry[3] += rss
+
+    @contextmanager
+    def active(self):
+        """Record the spans of this thread into this collector"""
+        previous = _local.collector
+        _local.collector = self
+        try:
+            yield self
+        finally:
+            _local.collector = previous
+
+    def rows(self) -> list:
+        """One dict per span name, slowest total first"""
+        with self._lock:
+            items = sorted(self.spans.items(), key=lambda item: -item[1][1])
+        return [
+            {"span": name, "count": count, "total_s": total, "mean_s": total / count, "max_s": peak, "rss_mb": rss / 2**20}
+            for name, (count, total, peak, rss) in items
+        ]
+
+
+def current():
+    """The collector active in this thread, None if instrumentation is off"""
+    return _local.collector
+
+
+class _Span:
+    __slots__ = ("collector", "name", "start", "rss")
+
+    def __init__(self, collector, name):
+        self.collector = collector
+        self.name = name
+
+    def __enter__(self):
+        self.rss = rss_bytes()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.start
+        self.collector.record(self.name, seconds, max(rss_bytes() - self.rss, 0))
+
+
+def span(name: str):
+    """Context manager recording the block under `name`; no-op without an active collector"""
+    collector = _local.collector
+    return _NOOP if collector is None else _Span(collector, name)
+
+
+def timed(name: str):
+    """Decorator recording every call of the function as a span"""
+
+    def decorate(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            collector = _local.collector
+            if collector is None:
+                return fn(*args, **kwargs)
+            with _Span(collector, name):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
+def propagate(fn):
+    """`fn` running with the caller's collector active, for thread pools"""
+    collector = _local.collector
+    if collector is None:
+        return fn
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        with collector.active():
+            return fn(*args, **kwargs)
+
+    return wrapper
+
+
+def to_json(scopes: dict) -> str:
+    """JSON of {scope: rows} for {scope: Collector}, e.g. {"rerun": ..., "session": ...}"""
+    return json.dumps({scope: collector.rows() for scope, collector in scopes.items()}, indent=1)
+
+
+def to_openmetrics(scopes: dict, prefix: str = "gar") -> str:
+    """OpenMetrics text exposition of {scope: Collector}, labelled by scope and span"""
+    families = (
+        ("span_seconds", "summary", "seconds", "Wall time of instrumented spans."),
+        ("span_max_seconds", "gauge", "seconds", "Longest single span."),
+        ("span_rss_growth_bytes", "counter", "bytes", "Growth of the resident set size during spans."),
+    )
+    lines = []
+    for name, kind, unit, help_text in families:
+        metric = f"{prefix}_{name}"
+        lines += [f"# TYPE {metric} {kind}", f"# UNIT {metric} {unit}", f"# HELP {metric} {help_text}"]
+        for scope, collector in scopes.items():
+            for row in collector.rows():
+                span_name = row["span"].replace("\\", "\\\\").replace('"', '\\"')
+                labels = f'{{scope="{scope}",span="{span_name}"}}'
+                if kind == "summary":
+                    lines.append(f"{metric}_count{labels} {row['count']}")
+                    lines.append(f"{metric}_sum{labels} {row['total_s']:.6f}")
+                elif kind == "gauge":
+                    lines.append(f"{metric}{labels} {row['max_s']:.6f}")
+                else:
+                    lines.append(f"{metric}_total{labels} {round(row['rss_mb'] * 2**20)}")
+    lines.append("# EOF")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,166 @@
+"""
+Memory accounting for loaded measurements and plot state.
+
+The dashboard keeps every loaded `DataSet` in its session and the stats
+tables of every parameter a user looked at in `plot_configs`. `MemoryLedger`
+records their sizes per session, counting a measurement shared by several
+sessions (the parse cache hands out one object) once in the server total.
+When a session or the server is over its budget (config `[memory]`), idle
+measurements are replaced by a `Spilled` placeholder after being saved in
+the compact store format (see store.py), and loaded back on the next access.
+`trim_plot_state` drops the stats tables of parameters that were looked at
+but never edited, commented or put in the report.
+
+Sizes come from `nbytes`, an estimate of the arrays and frames an object
+holds; interpreter overhead of small objects is not counted.
+"""
+import numpy as np
+import pandas as pd
+
+import threading
+import time
+
+MB = 2**20
+
+
+def nbytes(obj, skip=(), _seen=None) -> int:
+    """Bytes held by the arrays, frames and strings reachable from `obj`, except through `skip`"""
+    seen = {id(x) for x in skip} if _seen is None else _seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes if obj.base is None else 0  # views share their base's memory
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        usage = obj.memory_usage(deep=True, index=True)
+        return int(usage.sum() if isinstance(usage, pd.Series) else usage)
+    if isinstance(obj, (str, bytes)):
+        return len(obj)
+    if isinstance(obj, dict):
+        return sum(nbytes(k, _seen=seen) + nbytes(v, _seen=seen) for k, v in obj.items())
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        return sum(nbytes(x, _seen=seen) for x in obj)
+    total = 0
+    if hasattr(obj, "__dict__"):
+        total += nbytes(vars(obj), _seen=seen)
+    for name in getattr(type(obj), "__slots__", ()):
+        total += nbytes(getattr(obj, name, None), _seen=seen)
+    return total
+
+
+class Spilled:
+    """Placeholder of a measurement saved to disk, in place of the DataSet in the session"""
+
+    __slots__ = ("key", "archive", "title")
+
+    def __init__(self, key: str, archive: str, title: str):
+        self.key = key
+        self.archive = archive  # its key in the spill store
+        self.title = title
+
+    def __repr__(self):
+        return f"Spilled({self.key[:12]}, {self.title!r})"
+
+
+class MemoryLedger:
+    """
+    Sizes of what sessions hold, shared by all sessions of the server.
+
+    Every entry is (bytes, last use, shared key). Entries with the same
+    shared key, e.g. the `DataSet.key` of a measurement, count once in
+    `session_bytes` and `total_bytes`. Sessions that were not seen for `ttl` seconds are
+    dropped from the accounts, like Streamlit drops their state.
+    """
+
+    def __init__(self, ttl: float = 3600):
+        self.ttl = ttl
+        self._sessions = {}  # session -> {name: [bytes, last_used, shared]}
+        self._seen = {}  # session -> last update
+        self._lock = threading.Lock()
+
+    def update(self, session: str, name: str, size: int, shared: str = None):
+        now = time.monotonic()
+        with self._lock:
+            self._sessions.setdefault(session, {})[name] = [size, now, shared]
+            self._seen[session] = now
+
+    def touch(self, session: str, name: str):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._sessions.get(session, {}).get(name)
+            if entry is not None:
+                entry[1] = now
+            self._seen[session] = now
+
+    def forget(self, session: str, name: str = None):
+        """Drop one entry, or the whole session without `name`"""
+        with self._lock:
+            if name is None:
+                self._sessions.pop(session, None)
+                self._seen.pop(session, None)
+            else:
+                self._sessions.get(session, {}).pop(name, None)
+
+    def expire(self):
+        cutoff = time.monotonic() - self.ttl
+        with self._lock:
+            for session in [s for s, seen in self._seen.items() if seen < cutoff]:
+                self._sessions.pop(session, None)
+                self._seen.pop(session, None)
+
+    def entries(self, session: str) -> dict:
+        """name -> (bytes, last used, shared key) of one session"""
+        with self._lock:
+            return {name: tuple(entry) for name, entry in self._sessions.get(session, {}).items()}
+
+    def session_bytes(self, session: str) -> int:
+        return self._sum(self.entries(session).values())
+
+    def total_bytes(self) -> int:
+        with self._lock:
+            return self._sum(entry for entries in self._sessions.values() for entry in entries.values())
+
+    @staticmethod
+    def _sum(entries) -> int:
+        shared, total = {}, 0
+        for size, _, key in entries:
+            if key is None:
+                total += size
+            else:
+                shared[key] = size
+        return total + sum(shared.values())
+
+    def holders(self, shared: str) -> int:
+        """Number of sessions with an entry of the shared key"""
+        with self._lock:
+            return sum(any(e[2] == shared for e in entries.values()) for entries in self._sessions.values())
+
+    def rows(self) -> list:
+        """One dict per session: entries and MB, largest first"""
+        with self._lock:
+            rows = [
+                {"session": session[:8], "entries": len(entries), "mb": sum(e[0] for e in entries.values()) / MB}
+                for session, entries in self._sessions.items()
+            ]
+        return sorted(rows, key=lambda row: -row["mb"])
+
+
+def trim_plot_state(plot_state: dict, keep: int) -> int:
+    """
+    Drop the oldest stats tables of one plot (`plot_configs` entry) beyond
+    `keep`, sparing the selected parameter and those edited, commented or in
+    the report; returns the number dropped. Tables are ordered by last view.
+    """
+    analysis = plot_state.get("analysis_by_param", {})
+    report = plot_state.get("add_to_rep", {})
+    candidates = [
+        param
+        for param, state in analysis.items()
+        if param != plot_state.get("selected_param")
+        and param not in report
+        and not (state.get("edited") or state.get("comments"))
+    ]
+    dropped = candidates[: max(len(analysis) - keep, 0)]
+    for param in dropped:
+        del analysis[param]
+    return len(dropped)
@@ -0,0 +1,175 @@
+"""
+Lab-specific normative references built from healthy-subject sessions.
+
+`NormBuilder` keeps a running count, mean and sum of squared deviations
+(Welford) per domain, parameter, side and gait-cycle sample. Adding a
+session merges its curves into that state in one vectorized step (Chan et
+al.'s parallel update), so the reference is updated as sessions arrive
+without revisiting the archive; the state is saved to and resumed from an
+.npz file.
+
+The result is available as a `Param.df_norm`-style DataFrame for
+`Figure.add_band`, or as Visual3D-style norm files named after the config
+`norm_file` entries, readable wherever the exported norms are.
+"""
+import numpy as np
+import pandas as pd
+
+import os
+
+from core import Config, DataSet
+
+
+class NormBuilder:
+    """
+    Running mean and SD of curves per domain, parameter, side and sample.
+
+    Parameters
+    ----------
+    samples : int
+        Points per curve; longer curves are cut, shorter ones padded.
+    trials : bool
+        One observation per walking trial instead of one mean curve per
+        session and side.
+
+    Attributes
+    ----------
+    params : dict of str -> list of str
+        Domain -> parameter names, in config order when created.
+    sessions : int
+        Number of sessions added.
+    """
+
+    def __init__(self, samples: int = 101, trials: bool = False):
+        c = Config.load()
+        self.samples = samples
+        self.trials = trials
+        self.sessions = 0
+        self.params = {domain: [item["name"] for item in getattr(c, domain)] for domain in Config.domains}
+        self.count, self.mean, self.m2 = {}, {}, {}
+        for domain, names in self.params.items():
+            shape = (len(names), 2, samples)
+            self.count[domain] = np.zeros(shape)
+            self.mean[domain] = np.zeros(shape)
+            self.m2[domain] = np.zeros(shape)
+
+    def _observations(self, d: DataSet, domain: str) -> np.ndarray:
+        """(observation, param, side, sample) curves of `d` in this builder's layout, NaN where missing"""
+        cv = getattr(d, domain)
+        n = min(self.samples, cv.trials.shape[-1])
+        if self.trials:
+            curves = np.where(cv.dynamic[..., None], cv.trials, np.nan).transpose(2, 0, 1, 3)
+        else:
+            curves = cv.means[None]
+        out = np.full((len(curves), len(self.params[domain]), 2, self.samples), np.nan)
+        for i, name in enumerate(self.params[domain]):
+            if name in cv:
+                out[:, i, :, :n] = curves[:, cv[name].index, :, :n]
+        return out
+
+    def add(self, d: DataSet):
+        """Merge the curves of one session into the running statistics"""
+        for domain in Config.domains:
+            x = self._observations(d, domain)
+            valid = ~np.isnan(x)
+            n_b = valid.sum(axis=0)
+            sum_b = np.where(valid, x, 0.0).sum(axis=0)
+            mean_b = np.divide(sum_b, n_b, out=np.zeros(sum_b.shape), where=n_b > 0)
+            m2_b = np.where(valid, (x - mean_b) ** 2, 0.0).sum(axis=0)
+            self._merge(domain, n_b, mean_b, m2_b)
+        self.sessions += 1
+
+    def _merge(self, domain, n_b, mean_b, m2_b):
+        # Chan et al.: combine (n_a, mean_a, m2_a) with a batch (n_b, mean_b, m2_b)
+        n_a, mean_a = self.count[domain], self.mean[domain]
+        n = n_a + n_b
+        delta = mean_b - mean_a
+        share = np.divide(n_b, n, out=np.zeros(n.shape), where=n > 0)
+        self.mean[domain] = mean_a + delta * share
+        self.m2[domain] += m2_b + delta * delta * n_a * share
+        self.count[domain] = n
+
+    def merge(self, other: "NormBuilder"):
+        """Add the state of another builder, e.g. from a parallel batch"""
+        if other.params != self.params or other.samples != self.samples:
+            raise ValueError("Norm builders differ in parameters or samples")
+        for domain in Config.domains:
+            self._merge(domain, other.count[domain], other.mean[domain], other.m2[domain])
+        self.sessions += other.sessions
+
+    def mean_sd(self, domain: str, name: str, side: int = None):
+        """
+        (mean, sd) curves of one parameter; both sides pooled unless `side`
+        (0 left, 1 right) is given. NaN where fewer than two observations.
+        """
+        i = self.params[domain].index(name)
+        count, mean, m2 = self.count[domain][i], self.mean[domain][i], self.m2[domain][i]
+        if side is not None:
+            count, mean, m2 = count[side], mean[side], m2[side]
+        else:
+            # pool the sides with the same parallel update
+            n = count.sum(axis=0)
+            pooled = np.divide((count * mean).sum(axis=0), n, out=np.zeros(n.shape), where=n > 0)
+            m2 = (m2 + count * (mean - pooled) ** 2).sum(axis=0)
+            count, mean = n, pooled
+        with np.errstate(invalid="ignore", divide="ignore"):
+            sd = np.sqrt(m2 / (count - 1))
+        sd[count < 2] = np.nan
+        return np.where(count > 0, mean, np.nan), sd
+
+    def df_norm(self, domain: str, name: str, side: int = None) -> pd.DataFrame:
+        """`Param.df_norm` of the lab reference, ready for `Figure.add_band`"""
+        mean, sd = self.mean_sd(domain, name, side)
+        return pd.DataFrame({"Gait cycle": np.arange(self.samples), "Mean": mean, "SD": sd})
+
+    def write_norm_files(self, out_dir: str) -> list:
+        """
+        Write one Visual3D-style norm file (mean and SD of both sides
+        pooled) per parameter, named after its config `norm_file`.
+        """
+        c = Config.load()
+        os.makedirs(out_dir, exist_ok=True)
+        written = []
+        for domain in Config.domains:
+            for name in self.params[domain]:
+                item = c.by_name[domain].get(name)
+                if item is None:
+                    continue
+                mean, sd = self.mean_sd(domain, name)
+                header = [
+                    "\tGLOBAL\tGLOBAL",
+                    f"\t{name}\t{name}",
+                    "\tP2D\tP2D",
+                    "\tPROCESSED\tPROCESSED",
+                    "ITEM\t1\t2",
+                ]
+                body = [f"{i}\t{m:.3f}\t{s:.3f}" for i, (m, s) in enumerate(zip(mean, sd), 1)]
+                path = os.path.join(out_dir, item["norm_file"])
+                with open(path, "w", encoding="utf-8", newline="\n") as f:
+                    f.write("\n".join(header + body) + "\n")
+                written.append(path)
+        return written
+
+    def save(self, path: str):
+        """Store the running state, to be resumed with `load`"""
+        arrays = {}
+        for domain in Config.domains:
+            arrays[f"{domain}.params"] = np.array(self.params[domain])
+            arrays[f"{domain}.count"] = self.count[domain]
+            arrays[f"{domain}.mean"] = self.mean[domain]
+            arrays[f"{domain}.m2"] = self.m2[domain]
+        tmp = f"{path}.tmp.npz"
+        np.savez(tmp, samples=self.samples, trials=self.trials, sessions=self.sessions, **arrays)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "NormBuilder":
+        with np.load(path) as state:
+            builder = cls(int(state["samples"]), bool(state["trials"]))
+            builder.sessions = int(state["sessions"])
+            for domain in Config.domains:
+                builder.params[domain] = state[f"{domain}.params"].tolist()
+                builder.count[domain] = state[f"{domain}.count"]
+                builder.mean[domain] = state[f"{domain}.mean"]
+                builder.m2[domain] = state[f"{domain}.m2"]
+        return builder
@@ -0,0 +1,358 @@
+"""
+Bokeh figures of the dashboard, rendered to standalone HTML.
+
+Depends on Bokeh and the core only, so reports can be drawn without a
+Streamlit runtime (see batch.py).
+"""
+from bokeh.embed import json_item
+from bokeh.plotting import figure
+from bokeh.models import ColumnDataSource, Legend, LegendItem, Range1d, Band
+from bokeh.models.tickers import SingleIntervalTicker
+from bokeh.palettes import viridis
+from bokeh.resources import Resources
+
+import numpy as np
+import pandas as pd
+
+import json
+
+from core import Config, DataCompare, DataSet, Param
+from instrument import timed
+
+LINES_TOOLTIPS = "[@name] $snap_y{0.00} at $snap_x{0}%"  # for add_lines
+BOKEH_JS = Resources(mode="cdn", components=["bokeh"]).render_js()  # core bundle only
+# dash patterns of solid, dashed, dotted, dotdash, dashdot and a few more
+DASHES = ([], [6], [2, 4], [2, 4, 6, 4], [6, 4, 2, 4], [8, 2, 2, 2, 2, 2], [12, 4], [2, 6], [12, 3, 3, 3], [4, 4])
+
+
+@timed("plots.embed_html")
+def embed_html(models: list, columns: int = 1, cell=(0, 0)) -> str:
+    """
+    One HTML document showing Bokeh `models` in a grid of `columns`.
+
+    BokehJS is loaded once per document and every model is embedded from
+    its `json_item`, whose arrays travel as base64 typed arrays. `None`
+    entries leave an empty `cell` (height, width) in the grid. Streamlit
+    shows each document in its own `components.html` iframe, so a page
+    with several of them loads BokehJS once per iframe (from the browser
+    cache after the first); put figures in one call to share a load.
+    """
+    divs = []
+    items = {}
+    for i, model in enumerate(models):
+        if model is None:
+            divs.append(f'<div style="height:{cell[0]}px;width:{cell[1]}px"></div>')
+        else:
+            divs.append(f'<div id="bk-{i}"></div>')
+            items[f"bk-{i}"] = json_item(model)
+    items_json = json.dumps(items).replace("</", "<\\/")  # no backslash in f-string expressions before 3.12
+    return f"""<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+{BOKEH_JS}
+<style>
+body {{ margin: 0; }}
+.grid {{ display: grid; grid-template-columns: repeat({columns}, max-content); }}
+</style>
+</head>
+<body>
+<div class="grid">{"".join(divs)}</div>
+<script type="text/javascript">
+const items = {items_json};
+for (const [id, item] of Object.entries(items)) {{
+    Bokeh.embed.embed_item(item, id);
+}}
+</script>
+</body>
+</html>"""
+
+
+def compact(values: pd.Series) -> np.ndarray:
+    """Down-cast a 64-bit column to 32 bits, halving the typed array sent to the browser"""
+    casts = {"float64": np.float32, "int64": np.int32}
+    return values.to_numpy(dtype=casts.get(values.dtype.name))
+
+
+class Figure:
+    """
+    A class used to represent a Figure for plotting.
+
+    Attributes
+    ----------
+    figure : bokeh.plotting.figure
+        a figure object with various default attributes
+
+    Methods
+    -------
+    source(df, columns):
+        Returns the figure's shared data source for a DataFrame.
+    add_line(df, column, color, width, line_dash="solid"):
+        Adds a line to the figure.
+    add_lines(df, columns, colors, dashes, width):
+        Adds many lines to the figure as one glyph.
+    add_band(df_norm):
+        Adds a gray band to the figure.
+    add_legend(labels):
+        Adds a legend to the figure.
+    html():
+        Returns the figure as a standalone HTML document (see `embed_html`).
+    """
+
+    def __init__(
+        self,
+        y_axis=None,
+        x_label="Gait cycle, %",
+        y_label=None,
+        height=None,
+        width=None,
+        tooltips="[$name] @$name{0.00} at @{Gait cycle}%",  # [Mean] -0.77 at 33%
+    ):
+        c = Config.load()
+        self.figure = figure(
+            x_axis_label=x_label,
+            y_axis_label=y_label,
+            height=height or c.size["height"],
+            width=width or c.size["width"],
+            tools="pan, box_zoom, reset",
+            # will {Gait cycle} work for GRF?
+            tooltips=tooltips,
+            toolbar_location="above",
+            x_range=(0, 100),  # Limit the x-axis, default (-5, 105)
+        )
+        if y_axis is not None:
+            self.figure.y_range = Range1d(y_axis[0], y_axis[1])
+        self.figure.border_fill_color = "seashell"
+        self.figure.xaxis.axis_label_text_font_style = "normal"
+        self.figure.yaxis.axis_label_text_font_style = "normal"
+        self.figure.xaxis.axis_label_text_font_size = "14px"
+        self.figure.yaxis.axis_label_text_font_size = "14px"
+        self.figure.xaxis.ticker = SingleIntervalTicker(interval=10)
+        self.figure.toolbar.logo = None
+        self.sources = {}  # id(df) -> (df, ColumnDataSource)
+
+    def source(self, df, columns) -> ColumnDataSource:
+        """
+        One ColumnDataSource per DataFrame, shared by everything drawn from it
+        and holding only "Gait cycle" and the columns actually used.
+        """
+        # the frame is kept with its source so its id cannot be reused
+        _, source = self.sources.setdefault(id(df), (df, ColumnDataSource({"Gait cycle": compact(df["Gait cycle"])})))
+        for column in columns:
+            if column not in source.data:
+                source.data[column] = compact(df[column])
+        return source
+
+    def add_line(self, df, column, color, width, line_dash="solid"):
+        line = self.figure.line(
+            "Gait cycle",
+            column,
+            source=self.source(df, [column]),
+            color=color,
+            width=width,
+            name=column,
+            line_dash=line_dash,
+        )
+        return line
+
+    def add_lines(self, df, columns, colors, dashes, width):
+        """
+        Draw `columns` as a single multi-line glyph with per-line colors and
+        dash patterns: one renderer however many curves, where `add_line`
+        makes one each. Hover it with `LINES_TOOLTIPS`, and give legend
+        entries the line index (`LegendItem(..., index=i)`).
+        """
+        x = compact(df["Gait cycle"])
+        source = ColumnDataSource(
+            {
+                "xs": [x] * len(columns),
+                "ys": [compact(df[column]) for column in columns],
+                "color": list(colors),
+                "dash": list(dashes),
+                "name": list(columns),
+            }
+        )
+        return self.figure.multi_line("xs", "ys", source=source, color="color", line_dash="dash", width=width)
+
+    def add_band(self, df_norm):
+        # Build the bounds on a new frame to avoid modifying the original
+        df_band = pd.DataFrame(
+            {
+                "Gait cycle": df_norm["Gait cycle"],
+                # 1SD and 2SD boundaries
+                "Mean - SD": df_norm["Mean"] - df_norm["SD"],
+                "Mean + SD": df_norm["Mean"] + df_norm["SD"],
+                "Mean - 2SD": df_norm["Mean"] - 2 * df_norm["SD"],
+                "Mean + 2SD": df_norm["Mean"] + 2 * df_norm["SD"],
+                # Duplicate 'Mean' column as 'Normative' for tooltip reference
+                "Normative": df_norm["Mean"],
+            }
+        )
+        source = self.source(df_band, df_band.columns[1:])
+
+        # Add the 2SD band with a more transparent gray fill
+        band_2sd = Band(
+            base="Gait cycle",
+            lower="Mean - 2SD",
+            upper="Mean + 2SD",
+            source=source,
+            fill_color="gray",
+            fill_alpha=0.15,  # more transparent than the 1SD band
+        )
+        self.figure.add_layout(band_2sd)
+        
+        # Add the 1SD band (drawn on top of the 2SD band)
+        band_1sd = Band(
+            base="Gait cycle",
+            lower="Mean - SD",
+            upper="Mean + SD",
+            source=source,
+            fill_color="gray",
+            fill_alpha=0.25,
+        )
+        self.figure.add_layout(band_1sd)
+        
+        # Add a line for the actual mean value using the 'Normative' column
+        self.figure.line(
+            "Gait cycle",
+            "Normative",
+            source=source,
+            color="dimgray",
+            width=2,
+            line_dash="dashed",
+            name="Normative"
+        )
+
+    def add_band_classic(self, df_norm):
+        df_band = pd.DataFrame(
+            {
+                "Gait cycle": df_norm["Gait cycle"],
+                "Mean - SD": df_norm["Mean"] - df_norm["SD"],
+                "Mean + SD": df_norm["Mean"] + df_norm["SD"],
+            }
+        )
+        band = Band(
+            base="Gait cycle",
+            lower="Mean - SD",
+            upper="Mean + SD",
+            source=self.source(df_band, df_band.columns[1:]),
+            fill_color="gray",
+            fill_alpha=0.25,
+        )
+        self.figure.add_layout(band)
+
+    def add_legend(self, labels):
+        legend = Legend(items=labels)
+        legend.border_line_color = "black"
+        self.figure.add_layout(legend, "right")
+
+    def html(self) -> str:
+        return embed_html([self.figure])
+
+
+@timed("plots.param_figure")
+def param_figure(dfs: Param, foot2plot: str) -> Figure:
+    """Interactive plot of one parameter: trials of one side or both means, with norm bands"""
+    c = Config.load()
+    fig = Figure(y_axis=dfs.y_axis, y_label=dfs.y_label, x_label=dfs.x_label)
+    labels = []
+    df = {"Left": dfs.df_left, "Right": dfs.df_right, "Both": dfs.df_both}[foot2plot]
+    palette = viridis(len(df.columns) - 3)  # -(1st, Static, Mean)
+    for col in range(1, len(df.columns)):
+        column = df.columns[col]
+        if foot2plot == "Both":
+            if column == "Left Mean":
+                color = c.colors["left"]
+            elif column == "Right Mean":
+                color = c.colors["right"]
+            else:
+                color = c.colors["mean"]  # black in case column names change
+            line = fig.add_line(df, column, color, 3)
+        else:
+            if column == "Static":
+                color = c.colors["static"]
+            elif "Mean" in column:
+                continue  # add in diff style?
+            else:
+                color = palette[col - 1]
+            line = fig.add_line(df, column, color, 2)
+        labels.append((column, [line]))
+    df_norm = dfs.df_norm
+    if df_norm is not None:
+        fig.add_band(df_norm)
+    fig.add_legend(labels)
+    return fig
+
+
+@timed("plots.compare_figure")
+def compare_figure(dc: DataCompare, domain: str, name: str, foot2plot: str = "Both") -> Figure:
+    """
+    Mean curves of one parameter for every compared measurement, drawn as
+    one multi-line glyph so that ten sessions cost about as much as two.
+    A single side gets one color per measurement; with both sides, colors
+    follow the side and measurements differ in line dash.
+    """
+    c = Config.load()
+    dfs = dc.param(domain, name)
+    fig = Figure(y_label=dfs.y_label, x_label=dfs.x_label, tooltips=LINES_TOOLTIPS)
+    sides = ("Left", "Right") if foot2plot == "Both" else (foot2plot,)
+    palette = viridis(max(3, len(dc.labels)))
+    columns, colors, dashes, labels = [], [], [], []
+    for k, label in enumerate(dc.labels):
+        for side in sides:
+            columns.append(f"{side} Mean {k + 1}")
+            if foot2plot == "Both":
+                colors.append(c.colors[side.lower()])
+                dashes.append(DASHES[k % len(DASHES)])
+                labels.append(f"{side}, {label}")
+            else:
+                colors.append(palette[k])
+                dashes.append(DASHES[0])
+                labels.append(label)
+    lines = fig.add_lines(dc.df_means(domain, name), columns, colors, dashes, 2)
+    fig.add_legend([LegendItem(label=label, renderers=[lines], index=i) for i, label in enumerate(labels)])
+    return fig
+
+
+@timed("plots.layout_grid")
+def layout_grid(d: DataSet, domain: str = "kinematics") -> list:
+    """Rows of figures of all mean curves in the config layout, `None` for empty cells"""
+    c = Config.load()
+    data_dict = getattr(d, domain)
+    height = c.size["small_height"]
+    width = c.size["small_width"]
+    layout = getattr(c, f"layout_{domain}")
+    gridrows = [[None] * len(row) for row in layout]  # None is a placeholder in the layout
+    # only parameters placed in the layout are drawn
+    for param, (i, j) in c.grid_positions[domain].items():
+        if param not in data_dict:
+            continue
+        dfs = data_dict[param]
+        fig = Figure(height=height, width=width, y_axis=dfs.y_axis, y_label=dfs.y_label, x_label=dfs.x_label)
+        fig.figure.tools = []
+        df = dfs.df_both
+        for col in range(1, len(df.columns)):
+            column = df.columns[col]
+            if column == "Left Mean":
+                color = c.colors["left"]
+            elif column == "Right Mean":
+                color = c.colors["right"]
+            else:
+                color = c.colors["mean"]  # black in case column names change
+            fig.add_line(df, column, color, 2)
+        df_norm = dfs.df_norm
+        if df_norm is not None:
+            fig.add_band_classic(df_norm)
+        fig.figure.title.text = param
+        fig.figure.title.text_font_size = "16px"
+        fig.figure.min_border_right = 20
+        gridrows[i][j] = fig.figure
+    return gridrows
+
+
+def layout_html(d: DataSet, domain: str = "kinematics") -> str:
+    """Summary grid as one HTML document"""
+    c = Config.load()
+    gridrows = layout_grid(d, domain)
+    cell = (c.size["small_height"], c.size["small_width"])
+    return embed_html([fig for row in gridrows for fig in row], columns=len(gridrows[0]), cell=cell)
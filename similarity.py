@@ -0,0 +1,212 @@
+"""
+Similarity search over a library of gait curves.
+
+Every session becomes one float32 feature vector: the kinematics mean
+curves of both sides, concatenated in a fixed parameter order, minus the
+normative mean. A parameter without a norm keeps its raw curve, and a
+missing parameter is zero, i.e. treated as normal. Vectors are appended to
+a flat binary file, read through a memory map:
+
+    index/meta.json      parameter order, samples per curve, PCA size
+    index/rows.jsonl     one line per vector: archive hash and session fields
+    index/features.f32   (rows, dim) feature vectors
+    index/pca.npz        optional PCA basis, see `CurveIndex.fit_pca`
+    index/reduced.f32    (rows, components) PCA scores
+
+k-nearest-neighbour queries are a brute-force scan with one matrix-vector
+product; with PCA the scan runs over the small score matrix, and the best
+candidates are re-ranked with the full vectors, so distances stay exact.
+"""
+import numpy as np
+
+import json
+import os
+import threading
+
+from core import Config, DataSet
+from instrument import timed
+
+
+class CurveIndex:
+    """
+    On-disk index of session feature vectors with k-NN queries.
+
+    Appends from several threads of one process are safe; do not write to
+    the same index from two processes at once.
+
+    Parameters
+    ----------
+    root : str
+        Directory of the index, created if missing.
+    params : list of str, optional
+        Kinematics parameters of a new index, all config kinematics by
+        default; an existing index keeps its own.
+    samples : int
+        Points per curve, curves of another length are resampled.
+    """
+
+    def __init__(self, root: str, params: list = None, samples: int = 101):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self._lock = threading.Lock()
+        meta_path = os.path.join(root, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                self.meta = json.load(f)
+        else:
+            params = params or [item["name"] for item in Config.load().kinematics]
+            self.meta = {"params": params, "samples": samples, "components": 0}
+            self._write_meta()
+        self.dim = len(self.meta["params"]) * 2 * self.meta["samples"]
+        self.rows = []
+        rows_path = os.path.join(root, "rows.jsonl")
+        if os.path.exists(rows_path):
+            with open(rows_path) as f:
+                self.rows = [json.loads(line) for line in f]
+        self.keys = {row["key"]: i for i, row in enumerate(self.rows)}
+        self._pca = None
+        if self.meta["components"]:
+            with np.load(os.path.join(root, "pca.npz")) as pca:
+                self._pca = (pca["mean"], pca["components"])
+        self._features = self._reduced = None  # memory maps, reopened after appends
+
+    def _path(self, name):
+        return os.path.join(self.root, name)
+
+    def _write_meta(self):
+        with open(self._path("meta.json"), "w") as f:
+            json.dump(self.meta, f)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, key):
+        return key in self.keys
+
+    def vector(self, d: DataSet) -> np.ndarray:
+        """(dim,) float32 feature vector of one session"""
+        cv = d.kinematics
+        n = self.meta["samples"]
+        out = np.zeros((len(self.meta["params"]), 2, n), dtype=np.float32)
+        for i, name in enumerate(self.meta["params"]):
+            if name not in cv:
+                continue
+            p = cv[name].index
+            curves = cv.means[p] - cv.norms[p, :1] if cv.has_norm[p] else cv.means[p]
+            if curves.shape[-1] != n:
+                x = np.linspace(0, curves.shape[-1] - 1, n)
+                curves = np.stack([np.interp(x, np.arange(curves.shape[-1]), side) for side in curves])
+            out[i] = np.nan_to_num(curves)
+        return out.ravel()
+
+    def features(self) -> np.ndarray:
+        """(rows, dim) memory map of all vectors"""
+        if self._features is None or len(self._features) != len(self.rows):
+            self._features = self._map("features.f32", self.dim)
+        return self._features
+
+    def reduced(self) -> np.ndarray:
+        """(rows, components) memory map of the PCA scores"""
+        if self._reduced is None or len(self._reduced) != len(self.rows):
+            self._reduced = self._map("reduced.f32", self.meta["components"])
+        return self._reduced
+
+    def _map(self, name, width):
+        if not self.rows:
+            return np.empty((0, width), dtype=np.float32)
+        return np.memmap(self._path(name), dtype=np.float32, mode="r", shape=(len(self.rows), width))
+
+    def add(self, d: DataSet) -> bool:
+        """
+        Append the vector of `d` unless its session is indexed already,
+        whatever the config it was processed with; True if added.
+        """
+        if d.archive in self.keys:
+            return False  # before building the kinematics for the vector
+        vector = self.vector(d)
+        with self._lock:
+            if d.archive in self.keys:
+                return False
+            with open(self._path("features.f32"), "ab") as f:
+                f.write(vector.tobytes())
+            if self._pca is not None:
+                with open(self._path("reduced.f32"), "ab") as f:
+                    f.write(self.project(vector[None]).tobytes())
+            row = {"key": d.archive, **d.session_fields(), "title": d.title}
+            with open(self._path("rows.jsonl"), "a") as f:
+                f.write(json.dumps(row) + "\n")
+            self.keys[d.archive] = len(self.rows)
+            self.rows.append(row)
+        return True
+
+    def project(self, vectors: np.ndarray) -> np.ndarray:
+        mean, components = self._pca
+        return ((vectors - mean) @ components.T).astype(np.float32)
+
+    def fit_pca(self, n_components: int, chunk: int = 4096):
+        """
+        Fit a PCA basis of `n_components` to the indexed vectors and store
+        their scores; vectors added later are projected on append.
+
+        The covariance is accumulated in chunks, so the vectors are never
+        all in memory at once.
+        """
+        with self._lock:
+            features = self.features()
+            n = len(features)
+            n_components = min(n_components, self.dim, n)
+            mean = np.zeros(self.dim)
+            for start in range(0, n, chunk):
+                mean += features[start : start + chunk].sum(axis=0, dtype=np.float64)
+            mean /= n
+            cov = np.zeros((self.dim, self.dim))
+            for start in range(0, n, chunk):
+                block = features[start : start + chunk] - mean
+                cov += block.T @ block
+            _, vectors = np.linalg.eigh(cov)  # ascending eigenvalues
+            components = vectors[:, ::-1][:, :n_components].T.astype(np.float32)
+            self._pca = (mean.astype(np.float32), components)
+            np.savez(self._path("pca.npz"), mean=self._pca[0], components=components)
+            with open(self._path("reduced.f32"), "wb") as f:
+                for start in range(0, n, chunk):
+                    f.write(self.project(features[start : start + chunk]).tobytes())
+            self.meta["components"] = n_components
+            self._write_meta()
+            self._reduced = None
+
+    @timed("similarity.query")
+    def query(self, d: DataSet, k: int = 10, exclude=(), rerank: int = 4) -> list:
+        """
+        The `k` sessions closest to `d`, nearest first, as (row, distance)
+        pairs; the distance is the RMS difference of all curve points, in
+        the curves' units. Sessions whose archive hash is in `exclude` (and
+        `d` itself) are skipped. With PCA, `k * rerank` candidates are taken
+        from the scores and re-ranked exactly.
+        """
+        if not self.rows:
+            return []
+        q = self.vector(d)
+        skip = np.array([self.keys[key] for key in {d.archive, *exclude} if key in self.keys], dtype=np.intp)
+        if self._pca is not None:
+            candidates = np.sort(self._nearest(self.reduced(), self.project(q[None])[0], k * rerank, skip))
+            vectors = np.asarray(self.features()[candidates])
+            skip = np.empty(0, dtype=np.intp)  # not among the candidates
+        else:
+            candidates = np.arange(len(self.rows))
+            vectors = self.features()
+        order = self._nearest(vectors, q, k, skip)
+        dist = np.sqrt(np.maximum(((vectors[order] - q) ** 2).sum(axis=1), 0) / self.dim)
+        rows = candidates[order]
+        return [(self.rows[i], float(x)) for i, x in zip(rows, dist)]
+
+    @staticmethod
+    def _nearest(matrix, q, k, skip) -> np.ndarray:
+        """Row numbers of the `k` rows of `matrix` closest to `q`, nearest first"""
+        # |x - q|^2 = |x|^2 - 2 x.q + |q|^2, the last term is the same for all rows
+        dist = np.einsum("ij,ij->i", matrix, matrix) - 2 * (matrix @ q)
+        dist[skip] = np.inf
+        k = min(k, len(dist) - len(skip))
+        if k <= 0:
+            return np.empty(0, dtype=np.intp)
+        top = np.argpartition(dist, k - 1)[:k]
+        return top[np.argsort(dist[top])]
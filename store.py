@@ -0,0 +1,208 @@
+"""
+Persistent store of processed measurements.
+
+Each DataSet is saved as `{key}.npz`: the stacked curve arrays of both
+domains as they are, plus a JSON entry with the tables and parameter
+metadata. An SQLite index next to them maps subject, date, test condition
+and subsession to keys, so listing a subject's sessions or reopening one is
+an indexed lookup and an array load, with no zip upload or parsing.
+
+A domain that was never built, e.g. when an idle measurement is spilled,
+is saved as the zip bytes of the archive and built on first use after
+loading, instead of being built just to be saved.
+
+Entries are keyed by the archive hash (`DataSet.archive`) and record the
+digest of the config they were processed with, so a config edit replaces
+a session's entry on the next save instead of adding a second one.
+"""
+import numpy as np
+import pandas as pd
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+
+from core import Config, Curves, DataSet
+from ingest import LazyArchive
+from instrument import timed
+
+FIELDS = ("subject", "date", "condition", "subsession")
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS measurements (
+    key TEXT PRIMARY KEY,
+    subject TEXT,
+    date TEXT,
+    condition TEXT,
+    subsession TEXT,
+    title TEXT,
+    stored REAL,
+    config TEXT
+);
+CREATE INDEX IF NOT EXISTS by_session ON measurements (subject, date, condition, subsession);
+"""
+
+
+def frame_json(df: pd.DataFrame) -> dict:
+    return {"columns": list(df.columns), "name": df.columns.name, "data": df.to_numpy().tolist()}
+
+
+def json_frame(entry: dict) -> pd.DataFrame:
+    df = pd.DataFrame(entry["data"], columns=entry["columns"])
+    df.columns.name = entry["name"]
+    return df
+
+
+class MeasurementStore:
+    """
+    Directory of saved DataSets with an SQLite index.
+
+    Safe to share between Streamlit sessions: every call opens its own
+    SQLite connection, and files are written to a temp name first.
+
+    Parameters
+    ----------
+    root : str
+        Directory of the store, created if missing.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self.index = os.path.join(root, "index.sqlite")
+        with closing(self._connect()) as con, con:
+            con.executescript(SCHEMA)
+            columns = {row["name"] for row in con.execute("PRAGMA table_info(measurements)")}
+            if "config" not in columns:  # store created before entries recorded their config
+                con.execute("ALTER TABLE measurements ADD COLUMN config TEXT")
+
+    def _connect(self):
+        con = sqlite3.connect(self.index, timeout=30)
+        con.row_factory = sqlite3.Row
+        return con
+
+    def _path(self, key):
+        return os.path.join(self.root, f"{key}.npz")
+
+    def __contains__(self, key):
+        with closing(self._connect()) as con:
+            return con.execute("SELECT 1 FROM measurements WHERE key = ?", (key,)).fetchone() is not None
+
+    def config_of(self, key: str):
+        """Config digest the entry of `key` was processed with, None if there is no entry"""
+        with closing(self._connect()) as con:
+            row = con.execute("SELECT config FROM measurements WHERE key = ?", (key,)).fetchone()
+        return None if row is None else row["config"] or ""
+
+    def __len__(self):
+        with closing(self._connect()) as con:
+            return con.execute("SELECT COUNT(*) FROM measurements").fetchone()[0]
+
+    @timed("store.put")
+    def put(self, d: DataSet) -> bool:
+        """
+        Save `d` under `d.archive`, replacing an entry processed with
+        another config; True if written, False if it was stored already.
+        """
+        if self.config_of(d.archive) == d.config:
+            return False
+        arrays, meta = {}, {
+            "key": d.key,
+            "config": d.config,
+            "title": d.title,
+            "info": frame_json(d.info),
+            "ts": frame_json(d.ts),
+            "gps": [d.gps[0], frame_json(d.gps[1])],
+        }
+        unbuilt = d.unbuilt()
+        if unbuilt is not None:
+            arrays["archive"] = np.frombuffer(unbuilt[0], dtype=np.uint8)
+            meta["unbuilt"] = unbuilt[1]
+        for domain in Config.domains:
+            if domain in meta.get("unbuilt", {}):
+                continue
+            cv = getattr(d, domain)
+            for name in ("trials", "dynamic", "norms", "has_norm"):
+                arrays[f"{domain}.{name}"] = getattr(cv, name)
+            meta[domain] = {
+                "params": [
+                    {"name": p.name, "y_axis": p.y_axis, "y_label": p.y_label, "x_label": p.x_label}
+                    for p in cv.values()
+                ],
+                "trial_names": cv.trial_names,
+            }
+        arrays["meta"] = np.array(json.dumps(meta))
+        # write to a temp file first so readers never see a partial archive
+        tmp = f"{self._path(d.archive)}.{threading.get_ident()}.tmp.npz"
+        np.savez(tmp, **arrays)
+        os.replace(tmp, self._path(d.archive))
+        row = {"key": d.archive, **d.session_fields(), "title": d.title, "stored": time.time(), "config": d.config}
+        with closing(self._connect()) as con, con:
+            con.execute(
+                f"INSERT OR REPLACE INTO measurements ({', '.join(row)}) VALUES ({', '.join('?' * len(row))})",
+                tuple(row.values()),
+            )
+        return True
+
+    @timed("store.get")
+    def get(self, key: str) -> DataSet:
+        """The DataSet saved under `key`; KeyError if there is none"""
+        try:
+            npz = np.load(self._path(key))
+        except FileNotFoundError:
+            raise KeyError(key) from None
+        with npz:
+            meta = json.loads(npz["meta"][()])
+            unbuilt = meta.get("unbuilt", {})
+            tables = None
+            if unbuilt:
+                files = {item[k] for items in unbuilt.values() for item in items for k in ("left_file", "right_file", "norm_file")}
+                tables = LazyArchive(npz["archive"].tobytes(), files)
+            curves = {}
+            for domain in Config.domains:
+                if domain in unbuilt:
+                    curves[domain] = None
+                    continue
+                curves[domain] = Curves(
+                    npz[f"{domain}.trials"],
+                    npz[f"{domain}.dynamic"],
+                    npz[f"{domain}.norms"],
+                    npz[f"{domain}.has_norm"],
+                    [tuple(names) for names in meta[domain]["trial_names"]],
+                    meta[domain]["params"],
+                )
+        return DataSet.from_parts(
+            meta.get("key", key),
+            meta["title"],
+            json_frame(meta["info"]),
+            json_frame(meta["ts"]),
+            (meta["gps"][0], json_frame(meta["gps"][1])),
+            curves["kinematics"],
+            curves["kinetics"],
+            archive=key,
+            config=meta.get("config", ""),
+            tables=tables,
+            items=unbuilt,
+        )
+
+    def find(self, **fields) -> list:
+        """
+        Index rows (dicts with key, the `FIELDS`, title, stored time and config)
+        matching all given fields, e.g. `find(subject="Jane Doe")`.
+        """
+        unknown = set(fields) - set(FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+        where = " AND ".join(f"{name} = ?" for name in fields) or "1"
+        with closing(self._connect()) as con:
+            rows = con.execute(
+                f"SELECT * FROM measurements WHERE {where} ORDER BY subject, date, condition, subsession",
+                tuple(fields.values()),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def subjects(self) -> list:
+        with closing(self._connect()) as con:
+            return [row[0] for row in con.execute("SELECT DISTINCT subject FROM measurements ORDER BY subject")]
@@ -0,0 +1,296 @@
+"""
+Synthetic Visual3D export archives for load and scale testing.
+
+    python synth.py synthetic -n 20 --trials 50          # 20 archives of 50 trials
+    python synth.py synthetic --samples 1001 --missing 0.1 --nan-rate 0.001
+
+Archives have the layout `DataSet` expects: Info.txt, Temporal Distance.txt,
+MAP.txt and the left, right and norm curve files of every config parameter,
+each with the five Visual3D header rows. No patient data is involved:
+
+- each parameter gets a smooth base curve (a few Fourier harmonics) inside
+  its config `y_axis`, the same for every archive of a seed;
+- its norm file holds that curve and an SD of `noise` times the axis range;
+- every archive adds a subject offset per side, and every trial a smooth
+  deviation of the same size plus white noise;
+- kinematics files also hold a flat Static trial, like real exports;
+- MAP.txt holds GVS and GPS computed from the generated curves, and
+  Temporal Distance.txt consistent step and cycle times.
+
+Files can be left out at random (`missing`) and cells blanked
+(`nan_rate`), which sends those tables through the slower pandas reader.
+"""
+import numpy as np
+
+import argparse
+import os
+import sys
+import zipfile
+from io import BytesIO
+
+from core import Config
+
+# Visual3D signals of the GVS in MAP.txt, in the order of the config gps params
+MAP_SIGNALS = (
+    "Pelvic Angles_X", "Pelvic Angles_Y", "Pelvic Angles_Z",
+    "Hip Angles_X", "Hip Angles_Y", "Hip Angles_Z",
+    "Knee Angles_X", "Ankle Angles_X", "Foot Progression_Z",
+)
+FIRST_NAMES = ("Alex", "Sam", "Robin", "Kim", "Jordan", "Maria", "Yuri", "Lena")
+LAST_NAMES = ("Smith", "Ivanova", "Novak", "Garcia", "Tanaka", "Berg", "Rossi", "Kowalski")
+CONDITIONS = ("BF", "SH", "AFO")
+
+
+def _table(names: list, types: str, folder: str, components: list, body: np.ndarray, columns: list = None) -> bytes:
+    """Visual3D text export of `body` (rows, columns), blank cells for NaN"""
+    n = len(names)
+    columns = columns or ["GLOBAL"] * n
+    header = [
+        "\t" + "\t".join(columns),
+        "\t" + "\t".join(names),
+        "\t" + "\t".join([types] * n),
+        "\t" + "\t".join([folder] * n),
+        "ITEM\t" + "\t".join(components),
+    ]
+    fmt = "%d" + "\t%.2f" * n
+    lines = [fmt % (i, *row) for i, row in enumerate(body.tolist(), 1)]
+    text = "\n".join(header + lines) + "\n"
+    return text.replace("\tnan", "\t").encode("utf-8")
+
+
+def _text_table(names: list, values: list) -> bytes:
+    header = [
+        "\t" + "\t".join(["GLOBAL"] * len(names)),
+        "\t" + "\t".join(names),
+        "\t" + "\t".join(["TEXT_DATA"] * len(names)),
+        "\t" + "\t".join(["META"] * len(names)),
+        "ITEM\t" + "\t".join(["0"] * len(names)),
+    ]
+    return ("\n".join(header + ["1\t" + "\t".join(values)]) + "\n").encode("utf-8")
+
+
+def base_curves(items: list, samples: int, seed: int = 0) -> np.ndarray:
+    """(param, sample) smooth base curves within each item's `y_axis`"""
+    rng = np.random.default_rng(seed)
+    t = np.linspace(0, 1, samples)
+    k = np.arange(1, 5)[:, None]
+    curves = np.empty((len(items), samples))
+    for i, item in enumerate(items):
+        lo, hi = item["y_axis"]
+        amplitude = rng.uniform(0.2, 1.0, (4, 1)) / k
+        phase = rng.uniform(0, 2 * np.pi, (4, 1))
+        shape = (amplitude * np.sin(2 * np.pi * k * t + phase)).sum(axis=0)
+        shape = (shape - shape.min()) / np.ptp(shape)  # 0..1
+        curves[i] = lo + (hi - lo) * (0.3 + 0.4 * shape)
+    return curves
+
+
+def curve_set(items, samples, trials, noise, rng, seed):
+    """
+    (norm mean, norm SD, trials) of `items`: (param, sample),
+    (param, sample) and (param, side, trial, sample)
+    """
+    base = base_curves(items, samples, seed)
+    scale = np.array([hi - lo for lo, hi in (item["y_axis"] for item in items)])[:, None] * noise
+    t = np.linspace(0, 1, samples)
+    k = np.arange(1, 4)[:, None]
+    waves = np.sin(2 * np.pi * k * t + rng.uniform(0, 2 * np.pi, (len(items), 2, trials, 3, 1)))
+    smooth = (rng.normal(size=(len(items), 2, trials, 3, 1)) / k * waves).sum(axis=3)
+    offset = rng.normal(size=(len(items), 2, 1, 1))
+    white = 0.1 * rng.normal(size=(len(items), 2, trials, samples))
+    curves = base[:, None, None] + scale[:, None, None] * (offset + smooth + white)
+    return base, np.broadcast_to(scale, base.shape), curves
+
+
+def archive(
+    trials: int = 5,
+    samples: int = 101,
+    noise: float = 0.05,
+    missing: float = 0.0,
+    nan_rate: float = 0.0,
+    static: bool = True,
+    map_file: bool = True,
+    temporal: bool = True,
+    seed: int = 0,
+    session: int = 0,
+) -> bytes:
+    """
+    One synthetic export archive as zip bytes.
+
+    Parameters
+    ----------
+    trials : int
+        Walking trials per curve file.
+    samples : int
+        Samples per gait cycle.
+    noise : float
+        Between-trial and between-subject SD and norm SD, as a fraction of
+        each parameter's y-axis range.
+    missing : float
+        Probability to leave out each curve and norm file.
+    nan_rate : float
+        Fraction of trial cells left blank.
+    static : bool
+        Add a Static trial to the kinematics files.
+    map_file, temporal : bool
+        Write MAP.txt and Temporal Distance.txt.
+    seed : int
+        Seed of the base curves, shared by the archives of a cohort.
+    session : int
+        Seed of the subject and trial variation.
+    """
+    c = Config.load()
+    rng = np.random.default_rng([seed, session])
+    files = {}
+    trial_names = [f"Gait Synthetic {i + 1}.c3d" for i in range(trials)]
+    means = {}
+    for domain in Config.domains:
+        items = getattr(c, domain)
+        norm, sd, curves = curve_set(items, samples, trials, noise, rng, seed + Config.domains.index(domain))
+        if nan_rate:
+            curves[rng.random(curves.shape) < nan_rate] = np.nan
+        for i, item in enumerate(items):
+            means[item["name"]] = (norm[i], curves[i])
+            for side, key in enumerate(("left_file", "right_file")):
+                body = curves[i, side].T
+                names = trial_names
+                if static and domain == "kinematics":
+                    body = np.column_stack([body, np.full(samples, round(float(norm[i].mean()), 2))])
+                    names = trial_names + ["Static.c3d"]
+                signal = os.path.splitext(item[key])[0]
+                files[item[key]] = _table(
+                    [signal] * len(names), "LINK_MODEL_BASED", "ORIGINAL", ["X"] * len(names), body, names
+                )
+            signal = os.path.splitext(item["norm_file"])[0]
+            files[item["norm_file"]] = _table(
+                [signal] * 2, "P2D", "PROCESSED", ["1", "2"], np.column_stack([norm[i], sd[i]])
+            )
+    if missing:
+        for name in list(c.by_file):
+            if rng.random() < missing:
+                del files[name]
+
+    first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+    date = f"2025-{1 + session % 12:02d}-{1 + session % 28:02d}"
+    subject_id = f"SYN{seed:03d}-{session:05d}"
+    condition = CONDITIONS[session % len(CONDITIONS)]
+    files[c.info["file"]] = _text_table(
+        ["First Name", "Last Name", "ID", "DOB", "Creation date", "Height", "Weight", "Folder Name"],
+        [
+            first, last, subject_id, "2010-01-01", date,
+            f"{rng.uniform(1.2, 1.9):.2f} m", f"{rng.uniform(25, 90):.1f} kg",
+            f"C:\\Data\\{last}_{first}_{date}_{subject_id}\\{date}\\Synthetic - Full body_{condition}\\",
+        ],
+    )
+    if temporal:
+        files[c.temporal["file"]] = _temporal(rng)
+    if map_file:
+        files[c.gps["file"]] = _map([means.get(name) for name in c.gps["params"]])
+
+    output = BytesIO()
+    with zipfile.ZipFile(output, "w", zipfile.ZIP_DEFLATED) as zf:
+        for name, raw in files.items():
+            zf.writestr(name, raw)
+    return output.getvalue()
+
+
+def _temporal(rng) -> bytes:
+    cycle = rng.uniform(0.9, 1.3)
+    stride = rng.uniform(0.8, 1.4)
+    row = {"Cycle_Time_Mean": cycle, "Speed": stride / cycle, "Stride_Length_Mean": stride}
+    row["Stride_Width_Mean"] = rng.uniform(0.05, 0.15)
+    for side in ("Left", "Right"):
+        side_cycle = cycle * rng.uniform(0.97, 1.03)
+        row[f"{side}_Cycle_Time_Mean"] = side_cycle
+        row[f"{side}_Stance_Time_Mean"] = side_cycle * rng.uniform(0.57, 0.65)
+        row[f"{side}_Step_Time_Mean"] = side_cycle / 2
+        row[f"{side}_Step_Length_Mean"] = stride / 2 * rng.uniform(0.95, 1.05)
+        row[f"{side}_Steps_Per_Minute_Mean"] = 120 / side_cycle
+    for phase in ("Initial", "Terminal"):
+        row[f"Right_{phase}_Double_Limb_Support_Time_Mean"] = cycle * rng.uniform(0.08, 0.14)
+    header = [
+        "\t" + "\t".join(["GLOBAL"] * len(row)),
+        "\t" + "\t".join(row),
+        "\t" + "\t".join(["METRIC"] * len(row)),
+        "\t" + "\t".join(["TEMPORAL_DISTANCE"] * len(row)),
+        "ITEM\t" + "\t".join(["0"] * len(row)),
+    ]
+    body = "1\t" + "\t".join(f"{value:.4f}" for value in row.values())
+    return ("\n".join(header + [body]) + "\n").encode("utf-8")
+
+
+def _map(curves: list) -> bytes:
+    """MAP.txt of (norm mean, trials) per GPS parameter, None if missing"""
+    gvs = np.full((len(MAP_SIGNALS), 2), np.nan)  # (signal, side) median over trials
+    for i, pair in enumerate(curves):
+        if pair is not None:
+            norm, trials = pair
+            rms = np.sqrt(np.nanmean((trials - norm) ** 2, axis=-1))  # (side, trial)
+            gvs[i] = np.nanmedian(rms, axis=-1)
+    gps = np.sqrt(np.nanmean(gvs**2, axis=0))
+    row = {
+        "Left_GPS_mean_MEAN": gps[0],
+        "Right_GPS_mean_MEAN": gps[1],
+        "Overall_GPS_mean_MEAN": np.sqrt(np.nanmean(gvs**2)),
+    }
+    for side, values in zip(("Left", "Right"), gvs.T):
+        for signal, value in zip(MAP_SIGNALS, values):
+            row[f"{side} {signal}_gvs_MEDIAN"] = value
+    components = ["0"] * 3 + ["X"] * (len(row) - 3)
+    header = [
+        "\t" + "\t".join(["GLOBAL"] * len(row)),
+        "\t" + "\t".join(row),
+        "\t" + "\t".join(["METRIC"] * len(row)),
+        "\t" + "\t".join(["MAP"] * len(row)),
+        "ITEM\t" + "\t".join(components),
+    ]
+    body = "1\t" + "\t".join(f"{value:.1f}" for value in row.values())
+    return ("\n".join(header + [body]) + "\n").replace("\tnan", "\t").encode("utf-8")
+
+
+def write_archives(out_dir: str, n: int = 1, seed: int = 0, **kwargs) -> list:
+    """Write `n` archives (see `archive`) to `out_dir`; returns their paths"""
+    os.makedirs(out_dir, exist_ok=True)
+    paths = []
+    for session in range(n):
+        path = os.path.join(out_dir, f"synthetic_{seed:03d}_{session:05d}.zip")
+        with open(path, "wb") as f:
+            f.write(archive(seed=seed, session=session, **kwargs))
+        paths.append(path)
+    return paths
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Write synthetic Visual3D export archives.")
+    parser.add_argument("output", help="output directory")
+    parser.add_argument("-n", "--count", type=int, default=1, help="number of archives (default: %(default)s)")
+    parser.add_argument("--trials", type=int, default=5, help="walking trials per file (default: %(default)s)")
+    parser.add_argument("--samples", type=int, default=101, help="samples per gait cycle (default: %(default)s)")
+    parser.add_argument("--noise", type=float, default=0.05, help="variation, fraction of the y-axis range (default: %(default)s)")
+    parser.add_argument("--missing", type=float, default=0.0, help="probability to leave out a curve file (default: %(default)s)")
+    parser.add_argument("--nan-rate", type=float, default=0.0, help="fraction of blank trial cells (default: %(default)s)")
+    parser.add_argument("--no-static", action="store_true", help="no Static trial in the kinematics files")
+    parser.add_argument("--no-map", action="store_true", help="no MAP.txt, GPS is computed from the curves")
+    parser.add_argument("--no-temporal", action="store_true", help="no Temporal Distance.txt")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the base curves (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    paths = write_archives(
+        args.output,
+        args.count,
+        seed=args.seed,
+        trials=args.trials,
+        samples=args.samples,
+        noise=args.noise,
+        missing=args.missing,
+        nan_rate=args.nan_rate,
+        static=not args.no_static,
+        map_file=not args.no_map,
+        temporal=not args.no_temporal,
+    )
+    print(f"{len(paths)} archives in {args.output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,39 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)  # the modules are flat files in the repo root
+
+
+@pytest.fixture
+def load_archive():
+    """DataSet of zip bytes, read like the dashboard and batch do"""
+    from core import Config, DataSet
+    from ingest import read_archive
+
+    def load(data: bytes):
+        c = Config.load()
+        return DataSet(read_archive(data, c.required_files(), {c.info["file"]}))
+
+    return load
+
+
+@pytest.fixture
+def example_bytes():
+    """Zip bytes of an example archive, 1 or 2"""
+
+    def read(n=1):
+        with open(os.path.join(ROOT, "Examples", f"Data{n}.zip"), "rb") as f:
+            return f.read()
+
+    return read
+
+
+@pytest.fixture
+def example():
+    """DataSet of an example archive, 1 or 2"""
+    import batch
+
+    return lambda n=1: batch.load(os.path.join(ROOT, "Examples", f"Data{n}.zip"))
@@ -0,0 +1,25 @@
+import os
+import threading
+
+from cache import ParseCache
+
+
+def test_disk_tier_evicts_least_recently_used(tmp_path):
+    cache = ParseCache(1, str(tmp_path), disk_mb=2.5 / 1024)  # 2.5 KB: two 1 KB entries
+    for i, key in enumerate("abc"):
+        cache.put(key, b"x" * 1024)
+        os.utime(tmp_path / f"{key}.pkl", ns=(i * 10**9, i * 10**9))
+        cache.evict_disk(keep=key)
+    assert sorted(os.listdir(tmp_path)) == ["b.pkl", "c.pkl"]
+    cache.discard("b")
+    assert cache.get("b") == b"x" * 1024  # a disk hit refreshes its time
+    cache.put("d", b"x" * 1024)
+    assert sorted(os.listdir(tmp_path)) == ["b.pkl", "d.pkl"]
+
+
+def test_unpicklable_value_stays_in_memory(tmp_path):
+    cache = ParseCache(2, str(tmp_path))
+    value = threading.Lock()
+    cache.put("k", value)
+    assert cache.get("k") is value
+    assert os.listdir(tmp_path) == []
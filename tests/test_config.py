@@ -0,0 +1,19 @@
+import pytest
+
+from core import Config
+
+
+def test_config_loads():
+    c = Config.load()
+    assert set(c.by_name) == set(Config.domains)
+
+
+def test_missing_sections_and_keys_raise_one_value_error(tmp_path):
+    text = open(Config.file, encoding="utf-8").read()
+    text = text.replace("[memory]", "[memory_old]").replace('[store]\n', '[store]\nold_dir = ""\n').replace('\ndir = ""', "", 1)
+    path = tmp_path / "config.toml"
+    path.write_text(text, encoding="utf-8")
+    with pytest.raises(ValueError) as info:
+        Config(str(path))
+    assert "missing section [memory]" in str(info.value)
+    assert "[store] lacks dir" in str(info.value)
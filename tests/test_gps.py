@@ -0,0 +1,32 @@
+import numpy as np
+
+import synth
+from core import Config
+
+
+def test_gps_without_map_and_kinematics_is_nan(load_archive):
+    d = load_archive(synth.archive(map_file=False, missing=1.0))
+    assert len(d.kinematics) == 0
+    assert np.isnan(d.gps[0])
+    assert d.gps[1][["Left", "Right"]].isna().all().all()
+    assert d.gps_trials().empty
+
+
+def test_gait_profile_missing_param_is_nan(example):
+    cv = example().kinematics
+    names = Config.load().gps["params"]
+    full = cv.gait_profile(names)
+    gvs, gps, overall = cv.gait_profile(names + ["No such parameter"])
+    assert np.isnan(gvs[-1]).all()
+    np.testing.assert_array_equal(gvs[:-1], full[0])
+
+
+def test_gps_from_curves_matches_map(example):
+    d = example()
+    assert d.gps_from_curves()[0] == d.gps[0]
+
+
+def test_gait_profile_without_any_param_is_nan(example):
+    gvs, gps, overall = example().kinematics.gait_profile(["No such parameter", "Nor this one"])
+    assert gvs.shape[:2] == (2, 2)
+    assert np.isnan(gvs).all() and np.isnan(gps).all() and np.isnan(overall).all()
@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+import warnings
+
+from core import Config
+from norms import NormBuilder
+
+
+def observations(datasets, domain, name, side):
+    """(observation, sample) trial curves of one parameter and side, as NormBuilder(trials=True) takes them"""
+    rows = []
+    for d in datasets:
+        cv = getattr(d, domain)
+        p = cv[name].index
+        rows += [cv.trials[p, side, t] for t in range(cv.trials.shape[2]) if cv.dynamic[p, side, t]]
+    return np.array(rows)
+
+
+@pytest.fixture
+def datasets(example):
+    return [example(1), example(2)]
+
+
+@pytest.mark.parametrize("domain", Config.domains)
+def test_running_stats_match_numpy(datasets, domain):
+    builder = NormBuilder(trials=True)
+    for d in datasets:
+        builder.add(d)
+    for name in builder.params[domain]:
+        if name not in getattr(datasets[0], domain):
+            continue
+        for side in (0, 1):
+            x = observations(datasets, domain, name, side)
+            mean, sd = builder.mean_sd(domain, name, side)
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", RuntimeWarning)  # all-NaN samples
+                np.testing.assert_allclose(mean[: x.shape[1]], np.nanmean(x, axis=0), atol=1e-9)
+                np.testing.assert_allclose(sd[: x.shape[1]], np.nanstd(x, axis=0, ddof=1), atol=1e-9)
+
+
+def test_pooled_sides_match_numpy(datasets):
+    builder = NormBuilder()
+    for d in datasets:
+        builder.add(d)
+    name = builder.params["kinematics"][0]
+    means = np.array([d.kinematics.means[d.kinematics[name].index] for d in datasets]).reshape(-1, 101)
+    mean, sd = builder.mean_sd("kinematics", name)
+    np.testing.assert_allclose(mean, means.mean(axis=0), atol=1e-9)
+    np.testing.assert_allclose(sd, means.std(axis=0, ddof=1), atol=1e-9)
+
+
+def test_merge_equals_sequential_adds(datasets, tmp_path):
+    sequential = NormBuilder(trials=True)
+    for d in datasets:
+        sequential.add(d)
+    parts = [NormBuilder(trials=True) for _ in datasets]
+    for part, d in zip(parts, datasets):
+        part.add(d)
+    parts[0].save(tmp_path / "part.npz")
+    merged = NormBuilder.load(tmp_path / "part.npz")
+    merged.merge(parts[1])
+    assert merged.sessions == sequential.sessions == 2
+    for domain in Config.domains:
+        np.testing.assert_array_equal(merged.count[domain], sequential.count[domain])
+        np.testing.assert_allclose(merged.mean[domain], sequential.mean[domain], atol=1e-9)
+        np.testing.assert_allclose(merged.m2[domain], sequential.m2[domain], rtol=1e-9, atol=1e-6)
+
+
+def test_merge_rejects_other_layout():
+    with pytest.raises(ValueError):
+        NormBuilder(samples=101).merge(NormBuilder(samples=51))
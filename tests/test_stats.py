@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from core import STAT_COLUMNS, Config, DataCompare
+
+PHASES = {
+    "Full Cycle": (0, 100),
+    "Stance": (0, 60),
+    "Swing": (60, 100),
+    "Fractional": (10.5, 60.5),
+    "Single sample": (42, 42),
+    "Wrap-around": (60, 10),
+}
+
+
+def frame_stats(df_left, df_right, frames):
+    """Stats of one phase as the dashboard computed them per DataFrame before the curves were stacked"""
+    if frames[0] > frames[1]:
+        return [np.nan] * len(STAT_COLUMNS)
+
+    def stats(df, col):
+        df = df.loc[(df["Gait cycle"] >= frames[0]) & (df["Gait cycle"] <= frames[1])]
+        if df.empty:
+            return np.nan, np.nan, np.nan
+        mx = round(df.loc[df[col].idxmax(), col], 1)
+        mn = round(df.loc[df[col].idxmin(), col], 1)
+        return mx, mn, round(mx - mn, 1)
+
+    left = stats(df_left, "Left Mean")
+    right = stats(df_right, "Right Mean")
+    return [*left, *right, *(a - b for a, b in zip(left, right))]
+
+
+def expected_table(p, phases):
+    rows = [[name, *frames, *frame_stats(p.df_left, p.df_right, frames)] for name, frames in phases.items()]
+    return pd.DataFrame(rows, columns=["Phase", "% Start", "% End", *STAT_COLUMNS])
+
+
+@pytest.mark.parametrize("domain", Config.domains)
+def test_stats_table_matches_per_frame_stats(example, domain):
+    phases = {**PHASES, **Config.load().phases}
+    for p in getattr(example(), domain).values():
+        pd.testing.assert_frame_equal(p.stats_table(phases), expected_table(p, phases), check_dtype=False, atol=1e-9)
+
+
+def test_wrap_around_phase_is_nan(example):
+    p = next(iter(example().kinematics.values()))
+    assert np.isnan(p.stats_values([(60, 10)])).all()
+    assert not np.isnan(p.stats_values([(10, 60)])).any()
+
+
+def test_compare_stats_table_matches_each_dataset(example):
+    datasets = [example(1), example(2)]
+    dc = DataCompare(datasets)
+    name = dc.params["kinematics"][0]
+    table = dc.stats_table("kinematics", name, PHASES)
+    columns = [f"{side[0]} {stat}" for side in ("Left", "Right") for stat in ("Max", "Min", "ROM")]
+    for i, d in enumerate(datasets):
+        rows = table.iloc[i * len(PHASES) : (i + 1) * len(PHASES)]
+        expected = expected_table(d.kinematics[name], PHASES)
+        np.testing.assert_allclose(rows[columns].to_numpy(float), expected[columns].to_numpy(float), atol=1e-9)
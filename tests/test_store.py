@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+
+from cache import ParseCache
+from core import Config, DataSet
+from ingest import LazyArchive
+from store import MeasurementStore
+
+
+def assert_same_curves(a, b):
+    assert list(a) == list(b)
+    for name in ("trials", "dynamic", "norms", "has_norm"):
+        np.testing.assert_array_equal(getattr(a, name), getattr(b, name))
+    assert [tuple(names) for names in a.trial_names] == [tuple(names) for names in b.trial_names]
+    for p, q in zip(a.values(), b.values()):
+        assert (p.name, p.y_axis, p.y_label, p.x_label) == (q.name, q.y_axis, q.y_label, q.x_label)
+
+
+def assert_same_dataset(a, b):
+    assert (a.key, a.archive, a.config, a.title) == (b.key, b.archive, b.config, b.title)
+    pd.testing.assert_frame_equal(a.info, b.info, check_dtype=False)
+    pd.testing.assert_frame_equal(a.ts, b.ts, check_dtype=False)
+    assert a.gps[0] == b.gps[0] or (np.isnan(a.gps[0]) and np.isnan(b.gps[0]))
+    pd.testing.assert_frame_equal(a.gps[1], b.gps[1], check_dtype=False)
+    for domain in Config.domains:
+        assert_same_curves(getattr(a, domain), getattr(b, domain))
+
+
+def test_put_get_round_trip(example, tmp_path):
+    store = MeasurementStore(str(tmp_path))
+    d = example()
+    assert store.put(d)
+    assert not store.put(d)  # same archive and config
+    assert d.archive in store and len(store) == 1
+    assert store.config_of(d.archive) == d.config
+    assert [row["key"] for row in store.find(**d.session_fields())] == [d.archive]
+    assert_same_dataset(store.get(d.archive), d)
+
+
+def test_round_trip_of_unbuilt_domain(example_bytes, tmp_path):
+    c = Config.load()
+    data = example_bytes()
+
+    def lazy():
+        tables = LazyArchive(data, c.required_files(), {c.info["file"]})
+        return DataSet(tables, ParseCache.digest(data, c.digest), ParseCache.digest(data))
+
+    store = MeasurementStore(str(tmp_path))
+    d = lazy()
+    d.kinematics  # kinetics is never viewed
+    assert set(d.unbuilt()[1]) == {"kinetics"}
+    store.put(d)
+    stored = store.get(d.archive)
+    assert set(stored.unbuilt()[1]) == {"kinetics"}
+    assert_same_dataset(stored, lazy())